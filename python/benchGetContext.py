@@ -0,0 +1,208 @@
+"""
+Times the stages of getContext.py on synthetic interviews of increasing length,
+to show how the cost per token grows with the size of the TextGrid.
+
+For each length, synthTextGrid.py writes a TextGrid and .plt file, and these are timed separately:
+    load    reading the TextGrid and the plotnik file
+    tiers   finding the phone and word tiers and their interval start times
+    vowels  getContext.getTokenContext, finding each token's vowel interval, its neighbours and its word context
+    words   getContext.getTokenTranscriptions, transcribing each token's word and the following word
+    output  writing each token's line with writeContextInfo
+    full    getContext.getContext on the whole file, end to end
+
+The per token stages call the functions getContext.getContext's token loop calls,
+so changes to them show up here. They are timed over an evenly spaced sample of
+at most -n tokens and reported as microseconds per token, so multi-hour interviews
+stay quick to run. The full run covers every token; lengths longer than -f minutes
+skip it and report nan.
+The last table gives the exponent of per token cost against the number of phones:
+about 0 where a stage is linear in the length of the interview, about 1 where it is quadratic.
+
+Usage:
+    python benchGetContext.py [-m 1,10,60,180] [-n 1000] [-f 60] [-k dir] [-o results.txt -l label]
+"""
+
+import math
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import praat
+import getContext
+import synthTextGrid
+
+
+STAGES = ["load", "tiers", "vowels", "words", "output", "full"]
+WHOLE_FILE = ["load", "tiers", "full"]
+
+
+def sampleTokens(ntokens, n):
+    """Evenly spaced token indices, at most n of them"""
+    if n <= 0 or n >= ntokens:
+        return(list(range(ntokens)))
+    step = float(ntokens) / n
+    return([int(i * step) for i in range(n)])
+
+
+def benchFile(tgfile, pltfile, outfile, n, full = True):
+    """
+    Times getContext's stages on one TextGrid and plotnik file.
+    Returns the number of tokens and phones, and a dictionary of
+    seconds for load, tiers and full and seconds per token for the rest.
+    """
+    times = {}
+
+    start = time.time()
+    tg = praat.TextGrid()
+    tg.read(tgfile)
+    tokens, spinfo = getContext.readPlt(pltfile)
+    times["load"] = time.time() - start
+
+    start = time.time()
+    phone_Tier, word_Tier = getContext.getPhoneAndWordTier(tg, spinfo)
+    phone_xmins = [x.xmin() for x in tg[phone_Tier]]
+    word_xmins = [x.xmin() for x in tg[word_Tier]]
+    times["tiers"] = time.time() - start
+
+    sample = sampleTokens(len(tokens), n)
+    tokentimes = tokens.columns["Time"]
+
+    start = time.time()
+    found = []
+    for i in sample:
+        found.append((i,) + getContext.getTokenContext(tg, phone_Tier, word_Tier, phone_xmins, word_xmins, tokentimes[i]))
+    times["vowels"] = (time.time() - start) / len(sample)
+
+    start = time.time()
+    transcribed = []
+    for token in found:
+        transcribed.append(getContext.getTokenTranscriptions(tg, word_Tier, phone_Tier, token[2]))
+    times["words"] = (time.time() - start) / len(sample)
+
+    if os.path.exists(outfile):
+        os.remove(outfile)
+    start = time.time()
+    for (i, v, w, context, pre_Seg, post_Seg, post2_Seg), (word_Trans, post_word_Trans) in zip(found, transcribed):
+        getContext.writeContextInfo(outfile, spinfo, tokens, i, context, pre_Seg, post_Seg, post2_Seg,
+                                    word_Trans, post_word_Trans)
+    times["output"] = (time.time() - start) / len(sample)
+
+    times["full"] = float("nan")
+    if full:
+        if os.path.exists(outfile):
+            os.remove(outfile)
+        times["full"] = timeGetContext(tgfile, pltfile, os.path.dirname(outfile))
+
+    return(len(tokens), len(phone_xmins), times)
+
+
+def timeGetContext(tgfile, pltfile, savepath):
+    """Times getContext.getContext end to end, with its progress messages sent to os.devnull"""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        start = time.time()
+        getContext.getContext(tgfile, pltfile, savepath)
+        return(time.time() - start)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def slope(xs, ys):
+    """Least squares slope of log(ys) against log(xs), leaving out nan ys"""
+    points = [(x, y) for x, y in zip(xs, ys) if not math.isnan(y)]
+    if len(points) < 2:
+        return(float("nan"))
+    lx = [math.log(x) for x, y in points]
+    ly = [math.log(max(y, 1e-9)) for x, y in points]
+    mx = sum(lx) / len(lx)
+    my = sum(ly) / len(ly)
+    sxx = sum([(x - mx) ** 2 for x in lx])
+    if sxx == 0:
+        return(float("nan"))
+    return(sum([(x - mx) * (y - my) for x, y in zip(lx, ly)]) / sxx)
+
+
+def perToken(result, stage):
+    ntokens, nphones, times = result
+    if stage in WHOLE_FILE:
+        return(times[stage] / ntokens)
+    return(times[stage])
+
+
+def report(out, minutes, results):
+    """Writes the timing table and the per token cost exponents"""
+    out.write("%8s %8s %8s" % ("minutes", "tokens", "phones"))
+    for stage in STAGES:
+        out.write(" %12s" % (stage + " us/tok"))
+    out.write("\n")
+    for m, result in zip(minutes, results):
+        out.write("%8g %8d %8d" % (m, result[0], result[1]))
+        for stage in STAGES:
+            out.write(" %12.1f" % (perToken(result, stage) * 1e6))
+        out.write("\n")
+
+    if len(results) > 1:
+        nphones = [result[1] for result in results]
+        out.write("\nExponent of per token cost against phones (0 linear, 1 quadratic)\n")
+        for stage in STAGES:
+            out.write("%8s %6.2f\n" % (stage, slope(nphones, [perToken(result, stage) for result in results])))
+
+
+def appendResults(path, label, minutes, results):
+    """Appends one tab delimited line per length to a results file, to track changes between runs"""
+    new = not os.path.exists(path)
+    f = open(path, "a")
+    if new:
+        f.write("\t".join(["label", "date", "minutes", "tokens", "phones"] + STAGES) + "\n")
+    date = time.strftime("%Y-%m-%d %H:%M:%S")
+    for m, result in zip(minutes, results):
+        values = ["%.3f" % (perToken(result, stage) * 1e6) for stage in STAGES]
+        f.write("\t".join([label, date, "%g" % m, "%d" % result[0], "%d" % result[1]] + values) + "\n")
+    f.close()
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option("-m", "--minutes", action = "store", default = "1,10,60,180", dest = "minutes",
+                      help = "comma separated interview lengths")
+    parser.add_option("-n", "--sample", action = "store", type = "int", default = 1000, dest = "sample",
+                      help = "tokens timed per length, 0 for all")
+    parser.add_option("-f", "--full-max", action = "store", type = "float", dest = "fullmax",
+                      help = "longest length, in minutes, to also time end to end; all lengths by default")
+    parser.add_option("-r", "--seed", action = "store", type = "int", default = 0, dest = "seed")
+    parser.add_option("-k", "--keep", action = "store", dest = "keep",
+                      help = "directory to keep the synthetic files in")
+    parser.add_option("-o", "--output", action = "store", dest = "output",
+                      help = "results file to append to")
+    parser.add_option("-l", "--label", action = "store", default = "", dest = "label")
+
+    (options, args) = parser.parse_args()
+    minutes = [float(x) for x in options.minutes.split(",") if x]
+
+    savepath = options.keep
+    if savepath is None:
+        savepath = tempfile.mkdtemp()
+    elif not os.path.isdir(savepath):
+        os.makedirs(savepath)
+
+    results = []
+    try:
+        for m in minutes:
+            name = "synth%g" % m
+            tgfile, pltfile, ntokens = synthTextGrid.synthesize(name, m, savepath, options.seed)
+            outfile = os.path.join(savepath, name + ".txt")
+            full = options.fullmax is None or m <= options.fullmax
+            results.append(benchFile(tgfile, pltfile, outfile, options.sample, full))
+            sys.stderr.write("Timed %g minutes, %d tokens\n" % (m, ntokens))
+    finally:
+        if options.keep is None:
+            shutil.rmtree(savepath)
+
+    report(sys.stdout, minutes, results)
+    if options.output is not None:
+        appendResults(options.output, options.label, minutes, results)
@@ -0,0 +1,387 @@
+"""
+Runs getContext.py, recode.py and remeasure.py through a local result cache.
+
+Each job is keyed on a hash of its stage, the source of the stage script and
+the modules it imports, its options, and the contents of its input files.
+When the key is already cached the stored outputs are copied into place and
+the stage is not run. When a speaker's inputs or options change, the entry
+it had before is invalidated. Entries are evicted by age and then, least
+recently used first, by total size.
+
+Usage:
+    python cache.py [-c cachedir] [-o outfile] remeasure speaker.formants
+    python cache.py [-c cachedir] getContext [-s savepath] [-m] tgfile pltfile
+    python cache.py [-c cachedir] -j jobs.txt
+
+Each line of a jobs file is a stage and its arguments, optionally ending in
+"> outfile" to send recode.py or remeasure.py output to a file.
+"""
+
+import hashlib
+import json
+import optparse
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+## Scripts and the local modules they import, which together make up the code version
+STAGES = {
+    "getContext" : ["getContext.py", "tokentable.py"],
+    "recode" : ["recode.py", "tokentable.py"],
+    "remeasure" : ["remeasure.py", "tokentable.py", "vowelstats.py", "tracker.py", "trajectory.py"]
+    }
+
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".faav_cache")
+BLOCKSIZE = 1 << 20
+
+
+def hashFile(path):
+    """Returns the sha1 hex digest of a file's contents"""
+    h = hashlib.sha1()
+    f = open(path, "rb")
+    block = f.read(BLOCKSIZE)
+    while block:
+        h.update(block)
+        block = f.read(BLOCKSIZE)
+    f.close()
+    return(h.hexdigest())
+
+
+_versions = {}
+
+
+def codeVersion(stage):
+    """Hashes the source of a stage script and the modules it imports"""
+    if stage in _versions:
+        return(_versions[stage])
+    h = hashlib.sha1()
+    for name in STAGES[stage]:
+        h.update(name.encode("utf-8"))
+        h.update(hashFile(os.path.join(HERE, name)).encode("utf-8"))
+    _versions[stage] = h.hexdigest()
+    return(_versions[stage])
+
+
+class Job(object):
+    """
+    One run of a stage script.
+    argv is passed to the script, inputs are the files whose contents it depends on,
+    outfile is where its output is written, and stdout says whether that output
+    comes from standard output rather than being written by the script itself.
+    """
+
+    def __init__(self, stage, argv, inputs, outfile, stdout):
+        self.stage = stage
+        self.argv = argv
+        self.inputs = inputs
+        self.outfile = outfile
+        self.stdout = stdout
+
+    def key(self):
+        """
+        Hashes the stage, code version, arguments and input contents.
+        Every input's contents are hashed, however it was given on the command line
+        (such as --tracks=run2.txt or -trun2.txt).
+        """
+        h = hashlib.sha1()
+        h.update(self.stage.encode("utf-8"))
+        h.update(codeVersion(self.stage).encode("utf-8"))
+        for arg in self.argv:
+            h.update(arg.encode("utf-8"))
+            h.update(b"\0")
+        for path in self.inputs:
+            h.update(hashFile(path).encode("utf-8"))
+            h.update(b"\0")
+        return(h.hexdigest())
+
+    def slot(self):
+        """Identifies the speaker this job is for, so that a changed key invalidates the old entry"""
+        paths = [os.path.abspath(x) for x in self.inputs]
+        return("\t".join([self.stage] + paths + [os.path.abspath(self.outfile or "-")]))
+
+
+def getContextJobs(args):
+    """Makes one job per TextGrid and plotnik file pair given to getContext.py"""
+    parser = optparse.OptionParser()
+    parser.add_option("-m", "--multiple", action = "store_true", default = False, dest = "multiple")
+    parser.add_option("-s", "--savepath", action = "store", dest = "savepath")
+    (options, args) = parser.parse_args(args)
+
+    pairs = []
+    if options.multiple:
+        tgfiles = [x.rstrip() for x in open(args[0]) if x.rstrip() != ""]
+        pltfiles = [x.rstrip() for x in open(args[1]) if x.rstrip() != ""]
+        pairs = list(zip(tgfiles, pltfiles))
+    else:
+        pairs = [(args[0], args[1])]
+
+    ## getContext.py's own default savepath turns relative directories absolute,
+    ## so every job is given its savepath explicitly
+    jobs = []
+    for tgfile, pltfile in pairs:
+        savepath = options.savepath
+        if savepath is None:
+            savepath = os.path.dirname(tgfile) or "."
+        outfile = os.path.join(savepath, os.path.basename(tgfile).replace("TextGrid", "txt"))
+        argv = ["-s", savepath, tgfile, pltfile]
+        jobs.append(Job("getContext", argv, [tgfile, pltfile], outfile, False))
+    return(jobs)
+
+
+def makeJobs(stage, args, outfile = None):
+    """Makes the jobs for a stage and its command line arguments"""
+    if stage == "getContext":
+        return(getContextJobs(args))
+    if stage == "recode":
+        inputs = [args[0]]
+        ## a transcription argument longer than 2 characters is a CMU dictionary file
+        if len(args) > 3 and len(args[3]) > 2:
+            inputs.append(args[3])
+        return([Job("recode", args, inputs, outfile, True)])
+    if stage == "remeasure":
+        parser = optparse.OptionParser()
+        parser.add_option("-t", "--tracks", action = "append", default = [], dest = "tracks")
+        parser.add_option("-j", "--jump", action = "store", dest = "jump")
+        parser.add_option("-p", "--priors", action = "store", dest = "priors")
+        parser.add_option("-k", "--sample", action = "store", dest = "sample")
+        parser.add_option("--seed", action = "store", dest = "seed")
+        parser.add_option("--compare", action = "store_true", dest = "compare")
+        (options, files) = parser.parse_args(list(args))
+        inputs = files[:1] + options.tracks
+        if options.priors is not None:
+            inputs.append(options.priors)
+        return([Job("remeasure", args, inputs, outfile, True)])
+    raise ValueError("unknown stage %s" % stage)
+
+
+def readJobs(file):
+    """Reads a jobs file of stage and argument lines"""
+    jobs = []
+    for line in open(file):
+        words = shlex.split(line, comments = True)
+        if not words:
+            continue
+        outfile = None
+        if len(words) > 2 and words[-2] == ">":
+            outfile = words[-1]
+            words = words[:-2]
+        jobs.extend(makeJobs(words[0], words[1:], outfile))
+    return(jobs)
+
+
+class ResultCache(object):
+    """
+    A directory of cached stage outputs.
+    Each entry is a subdirectory named by its key holding the output and a
+    meta.json, and index.json maps each slot to its current key.
+    """
+
+    def __init__(self, path, maxsize = None, maxage = None):
+        self.path = path
+        self.maxsize = maxsize
+        self.maxage = maxage
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = []
+        self.evicted = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.indexfile = os.path.join(path, "index.json")
+        self.index = {}
+        if os.path.exists(self.indexfile):
+            f = open(self.indexfile)
+            self.index = json.load(f)
+            f.close()
+
+    def entry(self, key):
+        return(os.path.join(self.path, key))
+
+    def readMeta(self, key):
+        f = open(os.path.join(self.entry(key), "meta.json"))
+        meta = json.load(f)
+        f.close()
+        return(meta)
+
+    def writeMeta(self, key, meta):
+        f = open(os.path.join(self.entry(key), "meta.json"), "w")
+        json.dump(meta, f)
+        f.close()
+
+    def remove(self, key):
+        if os.path.isdir(self.entry(key)):
+            shutil.rmtree(self.entry(key))
+
+    def saveIndex(self):
+        f = open(self.indexfile, "w")
+        json.dump(self.index, f, indent = 1, sort_keys = True)
+        f.close()
+
+    def run(self, job, python = sys.executable):
+        """Runs a job, or restores its cached output. Returns the script's exit status."""
+        key = job.key()
+        slot = job.slot()
+
+        old = self.index.get(slot)
+        if old is not None and old != key:
+            if list(self.index.values()).count(old) == 1:
+                self.remove(old)
+            self.invalidated.append(slot)
+
+        if os.path.exists(os.path.join(self.entry(key), "meta.json")):
+            self.hits = self.hits + 1
+            self.restore(key, job)
+            meta = self.readMeta(key)
+            meta["used"] = time.time()
+            self.writeMeta(key, meta)
+            self.index[slot] = key
+            return(0)
+
+        self.misses = self.misses + 1
+        ## output bound for stdout goes to a temporary file of this job's own
+        tmp = None
+        if job.stdout and job.outfile is None:
+            fd, tmp = tempfile.mkstemp(suffix = ".tmp", dir = self.path)
+            os.close(fd)
+        try:
+            status = self.execute(job, python, tmp)
+            ## getContext.py writes no file when it finds no tokens
+            if status == 0 and not os.path.exists(job.outfile or tmp):
+                sys.stderr.write("%s wrote no %s\n" % (job.stage, job.outfile))
+                status = 1
+            if status == 0:
+                self.store(key, job, tmp)
+                self.index[slot] = key
+            elif slot in self.index:
+                del self.index[slot]
+        finally:
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+        return(status)
+
+    def execute(self, job, python, tmp = None):
+        """Runs the stage script, sending its standard output to tmp when the job has no outfile"""
+        command = [python, os.path.join(HERE, STAGES[job.stage][0])] + job.argv
+        if job.stdout:
+            out = open(job.outfile or tmp, "wb")
+            status = subprocess.call(command, stdout = out)
+            out.close()
+            return(status)
+        ## getContext.py appends to its output, so a stale copy is removed first
+        if os.path.exists(job.outfile):
+            os.remove(job.outfile)
+        return(subprocess.call(command))
+
+    def store(self, key, job, tmp = None):
+        """Copies a job's output, from its outfile or from tmp, into a new entry"""
+        self.remove(key)
+        os.makedirs(self.entry(key))
+        source = job.outfile or tmp
+        shutil.copyfile(source, os.path.join(self.entry(key), "output"))
+        if job.outfile is None:
+            self.copyOut(source)
+        now = time.time()
+        self.writeMeta(key, {"stage" : job.stage,
+                             "inputs" : job.inputs,
+                             "size" : os.path.getsize(source),
+                             "created" : now,
+                             "used" : now})
+
+    def restore(self, key, job):
+        """Copies a cached output into place"""
+        cached = os.path.join(self.entry(key), "output")
+        if job.outfile is None:
+            self.copyOut(cached)
+        else:
+            shutil.copyfile(cached, job.outfile)
+
+    def copyOut(self, path):
+        f = open(path, "rb")
+        out = getattr(sys.stdout, "buffer", sys.stdout)
+        shutil.copyfileobj(f, out)
+        f.close()
+        out.flush()
+
+    def entries(self):
+        """Returns (key, meta) for every entry"""
+        out = []
+        for key in os.listdir(self.path):
+            if os.path.exists(os.path.join(self.entry(key), "meta.json")):
+                out.append((key, self.readMeta(key)))
+        return(out)
+
+    def evict(self):
+        """Removes entries older than maxage days, then the least recently used until under maxsize bytes"""
+        entries = self.entries()
+        now = time.time()
+        keep = []
+        for key, meta in entries:
+            if self.maxage is not None and now - meta["used"] > self.maxage * 86400:
+                self.remove(key)
+                self.evicted = self.evicted + 1
+            else:
+                keep.append((key, meta))
+
+        if self.maxsize is not None:
+            keep.sort(key = lambda entry: entry[1]["used"])
+            total = sum([meta["size"] for key, meta in keep])
+            while keep and total > self.maxsize:
+                key, meta = keep.pop(0)
+                self.remove(key)
+                total = total - meta["size"]
+                self.evicted = self.evicted + 1
+
+        live = set([key for key, meta in keep])
+        for slot in list(self.index.keys()):
+            if self.index[slot] not in live:
+                del self.index[slot]
+
+    def report(self):
+        """Writes hit, miss, invalidation and eviction counts to stderr"""
+        sys.stderr.write("Cache: %d hits, %d misses, %d invalidated, %d evicted\n" %
+                         (self.hits, self.misses, len(self.invalidated), self.evicted))
+        for slot in self.invalidated:
+            sys.stderr.write("  invalidated %s\n" % slot.replace("\t", " "))
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage = "%prog [options] stage [stage arguments]")
+    parser.disable_interspersed_args()
+    parser.add_option("-c", "--cache", action = "store", default = DEFAULT_CACHE, dest = "cache")
+    parser.add_option("-j", "--jobs", action = "store", dest = "jobs")
+    parser.add_option("-o", "--output", action = "store", dest = "output")
+    parser.add_option("--max-size", action = "store", type = "float", dest = "maxsize",
+                      help = "evict least recently used entries above this many megabytes")
+    parser.add_option("--max-age", action = "store", type = "float", dest = "maxage",
+                      help = "evict entries unused for this many days")
+    parser.add_option("--python", action = "store", default = sys.executable, dest = "python")
+
+    (options, args) = parser.parse_args()
+
+    maxsize = None
+    if options.maxsize is not None:
+        maxsize = options.maxsize * (1 << 20)
+    cache = ResultCache(options.cache, maxsize, options.maxage)
+
+    if options.jobs is not None:
+        jobs = readJobs(options.jobs)
+    else:
+        jobs = makeJobs(args[0], args[1:], options.output)
+
+    failed = 0
+    for job in jobs:
+        if cache.run(job, options.python) != 0:
+            sys.stderr.write("%s failed on %s\n" % (job.stage, " ".join(job.inputs)))
+            failed = failed + 1
+
+    cache.evict()
+    cache.saveIndex()
+    cache.report()
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,267 @@
+"""
+Reads and writes typed columnar files that R can load with r/read.columns.R.
+
+The file starts with text metadata and is followed by one binary block per column:
+
+    FAAVCOL  1  nrow  ncol  nlines  nbytes      (tab delimited, nbytes zero padded)
+    name  type  nlevels                         (one line per column)
+    level                                       (the levels of every column, in column order)
+    <binary column blocks>
+
+nlines counts the metadata lines after the first and nbytes is the length of all
+the text, so the binary blocks start at byte nbytes. double columns are little
+endian float64 with NaN for NA. factor, character and logical columns are little
+endian int32, holding 1 based level codes (or 0/1 for logical) with R's
+NA_integer_ for NA.
+
+Columns are written a block of rows at a time, so a column's values may be
+anything that can be sliced into arrays, such as a memory map or values
+computed block by block.
+"""
+
+import numpy
+
+
+MAGIC = "FAAVCOL"
+VERSION = 1
+
+DOUBLE = "double"
+FACTOR = "factor"
+CHARACTER = "character"
+LOGICAL = "logical"
+
+NA_INTEGER = -2147483648
+BLOCKROWS = 1 << 18
+
+
+class Column(object):
+    """
+    A typed column. values holds float64 values for double columns,
+    0 based level codes (-1 for NA) for factor and character columns,
+    and 0/1/-1 for logical columns.
+    """
+
+    def __init__(self, name, type, values, levels = None):
+        self.name = name
+        self.type = type
+        self.values = values
+        if levels is None:
+            levels = []
+        self.levels = list(levels)
+
+    def __len__(self):
+        return(len(self.values))
+
+    def labels(self):
+        """Returns the column as a list of labels, with None for NA"""
+        if self.type == DOUBLE or self.type == LOGICAL:
+            return(list(self.values[:]))
+        return([self.levels[code] if code >= 0 else None for code in self.values[:]])
+
+
+def encodeCodes(values, type):
+    """Converts codes (-1 for NA) into the int32 values stored for a column type"""
+    values = numpy.asarray(values, dtype = numpy.int64)
+    if type == LOGICAL:
+        return(numpy.where(values < 0, NA_INTEGER, values).astype("<i4"))
+    return(numpy.where(values < 0, NA_INTEGER, values + 1).astype("<i4"))
+
+
+def decodeCodes(stored, type):
+    """Converts stored int32 values back into codes, with -1 for NA"""
+    stored = numpy.asarray(stored).astype(numpy.int32)
+    if type == LOGICAL:
+        return(numpy.where(stored == NA_INTEGER, -1, stored))
+    return(numpy.where(stored == NA_INTEGER, -1, stored - 1))
+
+
+class StoredCodes(object):
+    """The memory mapped int32 values of a factor, character or logical column, decoded a slice at a time"""
+
+    def __init__(self, stored, type):
+        self.stored = stored
+        self.type = type
+
+    def __len__(self):
+        return(len(self.stored))
+
+    def __getitem__(self, key):
+        return(decodeCodes(self.stored[key], self.type))
+
+
+def intern(labels, levels = None, index = None):
+    """
+    Codes a sequence of labels against a list of levels, adding new levels as
+    they are seen. None is coded as -1. Returns the codes, levels and index.
+    """
+    if levels is None:
+        levels = []
+    if index is None:
+        index = dict((level, i) for i, level in enumerate(levels))
+    codes = numpy.empty(len(labels), dtype = numpy.int32)
+    for i, label in enumerate(labels):
+        if label is None:
+            codes[i] = -1
+            continue
+        code = index.get(label)
+        if code is None:
+            code = len(levels)
+            index[label] = code
+            levels.append(label)
+        codes[i] = code
+    return(codes, levels, index)
+
+
+def recode(codes, levels, newlevels, newindex):
+    """
+    Maps codes against levels onto codes against newlevels, adding levels as needed.
+    Only the levels are looked up in Python; the codes are mapped with one take.
+    """
+    lookup, newlevels, newindex = intern(levels, newlevels, newindex)
+    lookup = numpy.append(lookup, -1).astype(numpy.int32)
+    return(lookup[codes], newlevels, newindex)
+
+
+def toBytes(text):
+    """
+    Encodes text as UTF-8. Byte strings, which is what Python 2 reads .plt and
+    other text files as, are taken to be UTF-8 already and written as they are.
+    """
+    if isinstance(text, bytes):
+        return(text)
+    return(text.encode("utf-8"))
+
+
+def writeColumns(path, columns):
+    """Writes a list of Columns to path"""
+    nrow = 0
+    if columns:
+        nrow = len(columns[0])
+    for column in columns:
+        if len(column) != nrow:
+            raise ValueError("column %s has %d rows, expected %d" % (column.name, len(column), nrow))
+
+    meta = []
+    for column in columns:
+        meta.append("%s\t%s\t%d" % (column.name, column.type, len(column.levels)))
+    for column in columns:
+        meta.extend(column.levels)
+    nlines = len(meta)
+    meta = b"".join([toBytes(line) + b"\n" for line in meta])
+
+    first = "%s\t%d\t%d\t%d\t%d\t" % (MAGIC, VERSION, nrow, len(columns), nlines)
+    nbytes = len(first) + 12 + 1 + len(meta)
+    first = ("%s%012d\n" % (first, nbytes)).encode("utf-8")
+
+    ## columns are written one block of rows at a time, seeking to each column's part of the block
+    itemsizes = [8 if column.type == DOUBLE else 4 for column in columns]
+    starts = [nbytes + nrow * sum(itemsizes[:j]) for j in range(len(columns))]
+    f = open(path, "wb")
+    f.write(first)
+    f.write(meta)
+    for a in range(0, nrow, BLOCKROWS):
+        b = min(a + BLOCKROWS, nrow)
+        for column, itemsize, start in zip(columns, itemsizes, starts):
+            f.seek(start + a * itemsize)
+            if column.type == DOUBLE:
+                numpy.asarray(column.values[a:b], dtype = "<f8").tofile(f)
+            else:
+                encodeCodes(column.values[a:b], column.type).tofile(f)
+    f.close()
+
+
+def readColumns(path, mmap = False):
+    """
+    Reads a file written by writeColumns, returning a list of Columns.
+    With mmap, columns are memory mapped rather than read into memory; factor,
+    character and logical columns then hold StoredCodes, decoded when sliced.
+    """
+    f = open(path, "rb")
+    first = f.readline().decode("utf-8").rstrip("\n").split("\t")
+    if first[0] != MAGIC:
+        f.close()
+        raise ValueError("%s is not a %s file" % (path, MAGIC))
+    nrow = int(first[2])
+    ncol = int(first[3])
+    nlines = int(first[4])
+    meta = [f.readline().decode("utf-8").rstrip("\n") for i in range(nlines)]
+
+    columns = []
+    pos = ncol
+    for desc in meta[:ncol]:
+        name, type, nlevels = desc.split("\t")
+        nlevels = int(nlevels)
+        columns.append(Column(name, type, None, meta[pos:pos + nlevels]))
+        pos = pos + nlevels
+
+    offset = int(first[5])
+    f.seek(offset)
+    for column in columns:
+        if column.type == DOUBLE:
+            if mmap and nrow > 0:
+                column.values = numpy.memmap(path, dtype = "<f8", mode = "r", offset = offset, shape = (nrow,))
+                f.seek(offset + 8 * nrow)
+            else:
+                column.values = numpy.fromfile(f, dtype = "<f8", count = nrow)
+            offset = offset + 8 * nrow
+        else:
+            if mmap and nrow > 0:
+                stored = numpy.memmap(path, dtype = "<i4", mode = "r", offset = offset, shape = (nrow,))
+                column.values = StoredCodes(stored, column.type)
+                f.seek(offset + 4 * nrow)
+            else:
+                column.values = decodeCodes(numpy.fromfile(f, dtype = "<i4", count = nrow), column.type)
+            offset = offset + 4 * nrow
+    f.close()
+    return(columns)
+
+
+class ColumnBuilder(object):
+    """
+    Accumulates a Column from blocks of values, such as one block per input file.
+    Blocks that do not supply the column are filled with NA by pad().
+    """
+
+    def __init__(self, name, type, length = 0):
+        self.name = name
+        self.type = type
+        self.parts = []
+        self.levels = []
+        self.index = {}
+        self.length = 0
+        self.pad(length)
+
+    def _add(self, values):
+        self.parts.append(values)
+        self.length = self.length + len(values)
+
+    def pad(self, length):
+        """Fills the column with NA up to length rows"""
+        if length > self.length:
+            if self.type == DOUBLE:
+                self._add(numpy.repeat(numpy.nan, length - self.length))
+            else:
+                self._add(numpy.repeat(numpy.int32(-1), length - self.length))
+
+    def addValues(self, values):
+        """Adds a block of double or logical values"""
+        self._add(numpy.asarray(values))
+
+    def addCodes(self, codes, levels):
+        """Adds a block of codes against levels, which may repeat and may contain None"""
+        codes, self.levels, self.index = recode(numpy.asarray(codes, dtype = numpy.int32),
+                                                levels, self.levels, self.index)
+        self._add(codes)
+
+    def addLabels(self, labels):
+        """Adds a block of labels"""
+        codes, self.levels, self.index = intern(labels, self.levels, self.index)
+        self._add(codes)
+
+    def column(self):
+        """Returns the accumulated Column"""
+        if self.type == DOUBLE:
+            values = numpy.concatenate(self.parts) if self.parts else numpy.zeros(0)
+        else:
+            values = numpy.concatenate(self.parts) if self.parts else numpy.zeros(0, dtype = numpy.int32)
+        return(Column(self.name, self.type, values, self.levels))
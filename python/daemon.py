@@ -0,0 +1,258 @@
+"""
+An optional long running worker for recode.py, getContext.py and remeasure.py.
+
+The server imports the stage scripts once (so rpy2 and the embedded R start
+once), keeps cmu dictionaries loaded by recode jobs, and keeps the vowel
+models remeasure calculates for each speaker file until the file changes,
+along with any corpus vowel models given with -p.
+Jobs are sent over a local Unix socket and run one at a time; their stdout
+and stderr are streamed back to the client as they are written.
+
+Usage:
+    python daemon.py --serve [-S socket]
+    python daemon.py [-S socket] recode file.txt 4 1 cmudict guess > recoded.txt
+    python daemon.py [-S socket] remeasure speaker.formants > speaker.txt
+    python daemon.py [-S socket] getContext [-s savepath] tgfile pltfile
+
+The stage arguments are the same as the scripts' own. recode jobs never prompt
+for missing transcriptions; words missing from the dictionary are left uncoded.
+"""
+
+import json
+import optparse
+import os
+import socket
+import sys
+import traceback
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser("~"), ".faav_daemon")
+STAGES = ["recode", "getContext", "remeasure"]
+FLUSHSIZE = 1 << 16
+
+
+class StreamWriter(object):
+    """
+    A file-like object that sends what is written to it to the client,
+    as JSON lines such as {"stdout": "..."}.
+    """
+
+    def __init__(self, wfile, name):
+        self.wfile = wfile
+        self.name = name
+        self.buffer = []
+        self.size = 0
+        self.softspace = 0
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.size = self.size + len(text)
+        if self.size >= FLUSHSIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            send(self.wfile, {self.name : "".join(self.buffer)})
+            self.buffer = []
+            self.size = 0
+
+
+def send(wfile, message):
+    """Writes one JSON line to a socket file"""
+    line = json.dumps(message) + "\n"
+    wfile.write(line.encode("utf-8"))
+    wfile.flush()
+
+
+class Workers(object):
+    """
+    The stage scripts, imported once, along with the lexicons and models kept between jobs.
+    """
+
+    def __init__(self):
+        self.modules = {}
+        self.lexicons = {}
+        self.models = {}
+        self.priors = {}
+
+    def module(self, stage):
+        """Imports a stage script the first time it is needed"""
+        if stage not in self.modules:
+            self.modules[stage] = __import__(stage)
+        return(self.modules[stage])
+
+    def preload(self, stages):
+        """Imports stage scripts ahead of the first job, reporting any that cannot be loaded"""
+        for stage in stages:
+            try:
+                self.module(stage)
+                sys.stderr.write("Loaded %s\n" % stage)
+            except ImportError:
+                sys.stderr.write("Could not load %s: %s\n" % (stage, sys.exc_info()[1]))
+
+    def lexicon(self, path):
+        """Returns a cmu dictionary, reading it again only if the file has changed"""
+        recode = self.module("recode")
+        mtime = os.path.getmtime(path)
+        if path not in self.lexicons or self.lexicons[path][0] != mtime:
+            self.lexicons[path] = (mtime, recode.readcmu(path))
+        return(self.lexicons[path][1])
+
+    def priorModels(self, path):
+        """Returns corpus vowel models for remeasure, reading them again only if the file has changed"""
+        remeasure = self.module("remeasure")
+        mtime = os.path.getmtime(path)
+        if path not in self.priors or self.priors[path][0] != mtime:
+            self.priors[path] = (mtime, remeasure.priorModels(remeasure.vowelstats.readStats(path)))
+        return(self.priors[path][1])
+
+    def recode(self, args):
+        recode = self.module("recode")
+        tocode, wordindex, vowelindex, transindex, sylindex, cmufile = recode.parseArgs(args)
+        cmu = None
+        if cmufile is not None:
+            cmu = self.lexicon(os.path.abspath(cmufile))
+        recode.recodeFile(tocode, wordindex, vowelindex, transindex, sylindex, cmu, ask = False)
+
+    def remeasure(self, args):
+        remeasure = self.module("remeasure")
+        parser = optparse.OptionParser()
+        parser.add_option("-t", "--tracks", action = "append", dest = "tracks")
+        parser.add_option("-j", "--jump", action = "store", type = "float", default = 1.0, dest = "jump")
+        parser.add_option("-p", "--priors", action = "store", dest = "priors")
+        parser.add_option("-k", "--sample", action = "store", type = "int", dest = "sample")
+        parser.add_option("--seed", action = "store", type = "int", default = 0, dest = "seed")
+        parser.add_option("--compare", action = "store_true", default = False, dest = "compare")
+        (options, args) = parser.parse_args(args)
+        if options.sample is not None and options.sample < remeasure.MINTOKENS:
+            parser.error("-k must be at least %d" % remeasure.MINTOKENS)
+        if options.tracks and options.priors is not None:
+            parser.error("-p is not used when choosing tracks with -t")
+        if options.tracks:
+            remeasure.remeasureTracks(args[0], options.tracks, options.jump, sample = options.sample, seed = options.seed,
+                                      compare = options.compare)
+            return
+
+        priors = None
+        if options.priors is not None:
+            priors = self.priorModels(os.path.abspath(options.priors))
+
+        path = os.path.abspath(args[0])
+        key = (path, os.path.getmtime(path), os.path.getsize(path), options.sample, options.seed)
+        ## --compare reports on estimating the models, so kept models are not reused for it
+        models = None
+        if not options.compare:
+            models = self.models.get(key)
+        models = remeasure.remeasureFile(args[0], models = models, priors = priors,
+                                         sample = options.sample, seed = options.seed, compare = options.compare)
+        for old in [k for k in self.models if k[0] == path and k != key]:
+            del self.models[old]
+        self.models[key] = models
+
+    def getContext(self, args):
+        getContext = self.module("getContext")
+        parser = optparse.OptionParser()
+        parser.add_option("-s", "--savepath", action = "store", dest = "savepath")
+        (options, args) = parser.parse_args(args)
+        getContext.getContext(args[0], args[1], options.savepath)
+
+    def run(self, request, stdout, stderr):
+        """Runs one job with stdout and stderr redirected. Returns an exit status."""
+        stage = request.get("stage")
+        if stage not in STAGES:
+            stderr.write("Unknown stage %s\n" % stage)
+            return(2)
+
+        saved = (sys.stdout, sys.stderr, os.getcwd())
+        sys.stdout = stdout
+        sys.stderr = stderr
+        status = 0
+        try:
+            os.chdir(request.get("cwd", saved[2]))
+            getattr(self, stage)(request.get("args", []))
+        except SystemExit:
+            status = sys.exc_info()[1].code or 0
+        except Exception:
+            traceback.print_exc(file = stderr)
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sys.stdout, sys.stderr = saved[0], saved[1]
+            os.chdir(saved[2])
+        return(status)
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """Reads one JSON job request and streams its output back"""
+
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode("utf-8"))
+        stdout = StreamWriter(self.wfile, "stdout")
+        stderr = StreamWriter(self.wfile, "stderr")
+        status = self.server.workers.run(request, stdout, stderr)
+        send(self.wfile, {"status" : status})
+
+
+class JobServer(socketserver.UnixStreamServer):
+    """Serves jobs one at a time, since the embedded R is not thread safe"""
+
+    def __init__(self, path, workers):
+        if os.path.exists(path):
+            os.remove(path)
+        socketserver.UnixStreamServer.__init__(self, path, JobHandler)
+        self.workers = workers
+
+
+def submit(path, stage, args):
+    """Sends a job to the server, copying its output to stdout and stderr. Returns its exit status."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    f = sock.makefile("rwb")
+    send(f, {"stage" : stage, "args" : args, "cwd" : os.getcwd()})
+
+    status = 1
+    for line in f:
+        message = json.loads(line.decode("utf-8"))
+        if "stdout" in message:
+            sys.stdout.write(message["stdout"])
+        elif "stderr" in message:
+            sys.stderr.write(message["stderr"])
+        elif "status" in message:
+            status = message["status"]
+            break
+    sys.stdout.flush()
+    f.close()
+    sock.close()
+    return(status)
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage = "%prog [options] stage [stage arguments]")
+    parser.disable_interspersed_args()
+    parser.add_option("-S", "--socket", action = "store", default = DEFAULT_SOCKET, dest = "socket")
+    parser.add_option("--serve", action = "store_true", default = False, dest = "serve")
+    parser.add_option("-p", "--preload", action = "store", default = ",".join(STAGES), dest = "preload")
+
+    (options, args) = parser.parse_args()
+
+    if options.serve:
+        workers = Workers()
+        workers.preload([x for x in options.preload.split(",") if x])
+        server = JobServer(options.socket, workers)
+        sys.stderr.write("Listening on %s\n" % options.socket)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        os.remove(options.socket)
+    else:
+        if len(args) < 1:
+            parser.error("no stage given")
+        sys.exit(submit(options.socket, args[0], args[1:]))
@@ -0,0 +1,225 @@
+"""
+Joins the formant frames written by praat/tracker.Praat onto the tokens in
+getContext.py output, giving one row per frame with the token's context columns.
+
+Each tracker token spans the times of its first and last frames. The spans are
+sorted by start time and every getContext token's measurement time is located
+among them with searchsorted; the frames of each matched span are then
+gathered with array arithmetic, so there is no loop over frames.
+
+A token is matched to the span holding its time, and only when no span holds it
+to a span within -w seconds of it; either way the tracker Word must be the
+token's word, ignoring case.
+
+getContext.py output has no header; its columns are named as in CONTEXT_COLUMNS,
+with any speaker fields past the sixth named Speaker7, Speaker8 and so on.
+Each line starts with the fields of the .plt file's speaker line, however many there are,
+so give the .plt file with -p or the number of speaker fields with -n when it is
+not the usual six.
+The joined table is written as a typed columnar file for r/read.columns.R.
+
+Usage:
+    python framejoin.py [-o joined.col] [-w window] [-p speaker.plt | -n nfields] speaker.txt ey.txt [ay.txt ...]
+"""
+
+import optparse
+import sys
+
+import numpy
+
+import columnfile
+import tracker
+
+
+SPEAKER_COLUMNS = ["Name", "Age", "Sex", "City", "State", "Year"]
+PLT_COLUMNS = ["PltF1", "PltF2", "PltF3", "VClass"]
+ENV_COLUMNS = ["fm", "fp", "fv", "ps", "fs"]
+TAIL_COLUMNS = ["Dur_Stress", "Info", "Word", "TokenTime", "Context",
+                "PreSeg", "PostSeg", "Post2Seg", "WordTrans", "PostWordTrans"]
+CONTEXT_COLUMNS = SPEAKER_COLUMNS + PLT_COLUMNS + ENV_COLUMNS + TAIL_COLUMNS
+CONTEXT_NUMERIC = ["PltF1", "PltF2", "PltF3", "TokenTime"]
+
+FRAME_COLUMNS = ["Time", "nformants", "F1", "B1", "F2", "B2", "F3", "B3", "F4", "B4", "F5", "B5"]
+
+
+def speakerColumns(nspeaker):
+    """Names nspeaker speaker fields, as SPEAKER_COLUMNS and then Speaker7, Speaker8 ..."""
+    extra = ["Speaker%d" % (i + 1) for i in range(len(SPEAKER_COLUMNS), nspeaker)]
+    return((SPEAKER_COLUMNS + extra)[:nspeaker])
+
+
+def pltSpeakerFields(pltfile):
+    """Returns the number of comma separated fields on a .plt file's speaker line"""
+    f = open(pltfile)
+    spinfo = f.readline().rstrip().split(",")
+    f.close()
+    return(len(spinfo))
+
+
+def readContext(path, nspeaker = len(SPEAKER_COLUMNS)):
+    """
+    Reads getContext.py output whose lines start with nspeaker speaker fields.
+    Returns the column names and a dictionary of column lists.
+    The plotnik environment codes take however many fields the line has between
+    the plotnik and the word columns, padded with None to five.
+    Raises ValueError when a numeric column does not parse, which is what a wrong
+    nspeaker shifts into them.
+    """
+    names = speakerColumns(nspeaker) + PLT_COLUMNS + ENV_COLUMNS + TAIL_COLUMNS
+    head = nspeaker + len(PLT_COLUMNS)
+    tail = len(TAIL_COLUMNS)
+    columns = dict((name, []) for name in names)
+    f = open(path)
+    for n, line in enumerate(f):
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) < head + tail:
+            continue
+        env = fields[head:-tail] + [None] * len(ENV_COLUMNS)
+        if len(fields) - head - tail > len(ENV_COLUMNS):
+            raise ValueError("%s line %d has %d plotnik environment fields; is %d the right number of speaker fields?" %
+                             (path, n + 1, len(fields) - head - tail, nspeaker))
+        fields = fields[:head] + env[:len(ENV_COLUMNS)] + fields[-tail:]
+        for name, value in zip(names, fields):
+            columns[name].append(value)
+        for name in CONTEXT_NUMERIC + ["VClass"]:
+            try:
+                float(columns[name][-1])
+            except ValueError:
+                raise ValueError("%s line %d: %s is %r, not a number; is %d the right number of speaker fields?" %
+                                 (path, n + 1, name, columns[name][-1], nspeaker))
+    f.close()
+    return(names, columns)
+
+
+def tokenSpans(frames):
+    """Returns the times of the first and last frames of each tracker token"""
+    first = frames.time[frames.starts]
+    last = frames.time[frames.starts + frames.lengths - 1]
+    return(first, last)
+
+
+def spanAt(times, sfirst, slast, window):
+    """
+    Returns the position in the sorted spans of the last span starting within window
+    seconds before each time, and whether that span, widened by window, holds the time.
+    """
+    j = numpy.searchsorted(sfirst, times + window, side = "right") - 1
+    jc = numpy.maximum(j, 0)
+    valid = (j >= 0) & (times >= sfirst[jc] - window) & (times <= slast[jc] + window)
+    return(jc, valid)
+
+
+def matchTokens(times, first, last, window = 0.025, words = None, trackwords = None):
+    """
+    Finds the tracker token whose span holds each time or, for times no span holds,
+    whose span widened by window seconds on each side holds it.
+    words and trackwords are optional word codes of the times and the tracker tokens;
+    when given, a span is only matched by a time with the same word.
+    Returns the matched time indices and tracker token indices, ordered by time.
+    A tracker token matched by more than one time keeps only the earliest.
+    """
+    if len(first) == 0:
+        empty = numpy.zeros(0, dtype = numpy.intp)
+        return(empty, empty)
+    order = numpy.argsort(first, kind = "mergesort")
+    sfirst = first[order]
+    slast = last[order]
+
+    j, valid = spanAt(times, sfirst, slast, 0.0)
+    wj, wvalid = spanAt(times, sfirst, slast, window)
+    if words is not None:
+        swords = trackwords[order]
+        valid = valid & (swords[j] == words)
+        wvalid = wvalid & (swords[wj] == words)
+    j = numpy.where(valid, j, wj)
+    valid = valid | wvalid
+
+    t = numpy.flatnonzero(valid)
+    t = t[numpy.argsort(times[t], kind = "mergesort")]
+    k = order[j[t]]
+    keep = numpy.sort(numpy.unique(k, return_index = True)[1])
+    return(t[keep], k[keep])
+
+
+def wordCodes(context, frames):
+    """Returns codes of the getContext and tracker token words, upper cased, from a shared lookup"""
+    codes, levels, lookup = columnfile.intern([word.upper() for word in context["Word"]] +
+                                              [labels[1 + tracker.TRACKER_LABELS.index("Word")].upper()
+                                               for labels in frames.labels])
+    n = len(context["Word"])
+    return(codes[:n], codes[n:])
+
+
+def gatherFrames(frames, tokens):
+    """Returns the frame indices of a list of tracker tokens, in order, and the position in tokens of each frame"""
+    lengths = frames.lengths[tokens]
+    offsets = numpy.cumsum(lengths) - lengths
+    owner = numpy.repeat(numpy.arange(len(tokens)), lengths)
+    index = numpy.arange(lengths.sum()) - offsets[owner] + frames.starts[tokens][owner]
+    return(index, owner)
+
+
+def joinFrames(names, context, frames, window = 0.025):
+    """
+    Joins tracker Frames onto getContext tokens, read by readContext as names and context.
+    Returns a list of columnfile Columns with one row per frame of every matched token,
+    and the number of getContext tokens and tracker tokens matched.
+    """
+    times = numpy.array([float(x) for x in context["TokenTime"]])
+    first, last = tokenSpans(frames)
+    words, trackwords = wordCodes(context, frames)
+    matched, tokens = matchTokens(times, first, last, window, words, trackwords)
+    index, owner = gatherFrames(frames, tokens)
+    rowtoken = matched[owner]
+
+    columns = [columnfile.Column("Token", columnfile.DOUBLE, (rowtoken + 1).astype(numpy.float64))]
+    for name in names:
+        if name in CONTEXT_NUMERIC:
+            values = numpy.array([float(x) for x in context[name]])
+            columns.append(columnfile.Column(name, columnfile.DOUBLE, values[rowtoken]))
+        else:
+            codes, levels, lookup = columnfile.intern(context[name])
+            columns.append(columnfile.Column(name, columnfile.FACTOR, codes[rowtoken], levels))
+
+    for i, name in enumerate(["File"] + tracker.TRACKER_LABELS):
+        codes, levels, lookup = columnfile.intern([labels[i] for labels in frames.labels])
+        columns.append(columnfile.Column("Track" + name, columnfile.FACTOR, codes[tokens][owner], levels))
+
+    values = [frames.time, frames.nformants]
+    for k in range(5):
+        values.extend([frames.F[:, k], frames.B[:, k]])
+    for name, column in zip(FRAME_COLUMNS, values):
+        columns.append(columnfile.Column(name, columnfile.DOUBLE, column[index]))
+    return(columns, len(matched), len(tokens))
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage = "%prog [options] context.txt tracks.txt [tracks2.txt ...]")
+    parser.add_option("-o", "--output", action = "store", default = "frames.col", dest = "output")
+    parser.add_option("-w", "--window", action = "store", type = "float", default = 0.025, dest = "window",
+                      help = "seconds a token's time may fall outside its frames")
+    parser.add_option("-p", "--plt", action = "store", dest = "plt",
+                      help = "the .plt file the getContext file was made from, for its number of speaker fields")
+    parser.add_option("-n", "--speaker-fields", action = "store", type = "int", dest = "nspeaker",
+                      help = "number of speaker fields starting each getContext line, 6 by default")
+
+    (options, args) = parser.parse_args()
+    if len(args) < 2:
+        parser.error("give a getContext file and at least one tracker file")
+    if options.plt is not None and options.nspeaker is not None:
+        parser.error("give only one of -p and -n")
+
+    nspeaker = len(SPEAKER_COLUMNS)
+    if options.plt is not None:
+        nspeaker = pltSpeakerFields(options.plt)
+    elif options.nspeaker is not None:
+        nspeaker = options.nspeaker
+    try:
+        names, context = readContext(args[0], nspeaker)
+    except ValueError as e:
+        parser.error(str(e))
+    frames = tracker.loadTracker(args[1:])
+    columns, ncontext, ntracks = joinFrames(names, context, frames, options.window)
+    columnfile.writeColumns(options.output, columns)
+    sys.stderr.write("Joined %d frames: %d of %d tokens matched %d of %d tracked tokens\n" %
+                     (len(columns[0]), ncontext, len(context["TokenTime"]), ntracks, len(frames)))
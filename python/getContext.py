@@ -4,24 +4,13 @@ import string
 import os
 import optparse
 import sys
+import tokentable
 
 
 def readPlt(path):
-    """Reads in a plotnik file"""
-    fi = open(path, "r")
-    spinfo = fi.readline().rstrip().split(",")
-    fi.readline()
-    
-    lines = []
-    while fi:
-        line = fi.readline().rstrip()
-        if line == "":
-            break
-        else:
-            line = line.split(",")
-            line[-1] = line[-1].split(" ")
-            lines.append(line)
-    return(lines, spinfo)
+    """Reads in a plotnik file as a TokenTable"""
+    spinfo, tokens = tokentable.loadPlt(path)
+    return(tokens, spinfo)
         
         
 
@@ -125,15 +114,48 @@ def getWordTranscription(tg, word_Tier, phone_Tier, word_Index):
     return(word_str)
 
 
-def writeContextInfo(path, spinfo, line, context, pre_Seg, post_Seg, post2_Seg, word_Trans, post_word_Trans):
+def getTokenContext(tg, phone_Tier, word_Tier, phone_xmins, word_xmins, time, lo = 0):
+    """Finds the vowel interval at time, the segments around it, its word interval and its place in the word"""
+
+    v_Interval_index = getVowelInterval(tg, phone_Tier, phone_xmins, time, lo = lo)
+
+    pre_Interval_index = v_Interval_index - 1
+    post_Interval_index = v_Interval_index + 1
+    post2_Interval_index = v_Interval_index + 2
+
+    pre_Seg = tg[phone_Tier][pre_Interval_index].mark()
+    post_Seg = tg[phone_Tier][post_Interval_index].mark()
+    post2_Seg = tg[phone_Tier][post2_Interval_index].mark()
+
+    phone_Interval = tg[phone_Tier][v_Interval_index]
+
+    w_Interval_Index = getIntervalAtTime(word_xmins, phone_Interval.xmin()+0.001)
+    word_Interval = tg[word_Tier][w_Interval_Index]
+
+    context = getWordContext(word_Interval, phone_Interval)
+
+    return(v_Interval_index, w_Interval_Index, context, pre_Seg, post_Seg, post2_Seg)
+
+
+def getTokenTranscriptions(tg, word_Tier, phone_Tier, w_Interval_Index):
+    """Transcribes a token's word and the word after it"""
+
+    word_Trans = getWordTranscription(tg, word_Tier, phone_Tier, w_Interval_Index)
+    post_word_Trans = getWordTranscription(tg, word_Tier, phone_Tier, w_Interval_Index+1)
+
+    return(word_Trans, post_word_Trans)
+
+
+def writeContextInfo(path, spinfo, tokens, i, context, pre_Seg, post_Seg, post2_Seg, word_Trans, post_word_Trans):
     """Writes data to file"""
 
+    line = tokens.row(i, tokentable.PLT_COLUMNS)
     line[3] = line[3].split(".")
     line[3][-1] = string.join([x for x in line[3][-1]], sep = "\t")
     line[3] = string.join(line[3], "\t")
-    word = line[-1][0]
-    time = line[-1][-1]
-    line[-1] = string.join(line[-1], sep = " ")
+    info = line[-1].split(" ")
+    word = info[0]
+    time = info[-1]
     line.append(word)
     line.append(time)
     line = string.join(line, "\t")
@@ -155,7 +177,7 @@ def getContext(tgfile, pltfile, savepath):
     tg.read(tgfile)
     maxtime = tg.xmax()
     
-    lines, spinfo = readPlt(pltfile)
+    tokens, spinfo = readPlt(pltfile)
 
     path_elements = tgfile.split("/")
     print "Processing %s\n" %path_elements[-1]
@@ -187,13 +209,15 @@ def getContext(tgfile, pltfile, savepath):
 ##    v_Sub_Time, v_Sub_Interval = subDivideTime(tg, phone_Tier, 10)
 ##    w_Sub_Time, w_Sub_Interval = subDivideTime(tg, word_Tier, 10)
 
-    for line in lines:
-        time = float(line[-1][-1])
+    times = tokens.columns["Time"]
+
+    for i in range(len(tokens)):
+        time = times[i]
         if time > maxtime:
             print "Error! TextGrid ended early"
             break
         
-        word = line[-1][0]
+        word = tokens.get("Word", i)
 
 ##        v_Index = bisect.bisect(v_Sub_Time, time)
 ##        w_Index = bisect.bisect(w_Sub_Time, time)
@@ -206,63 +230,44 @@ def getContext(tgfile, pltfile, savepath):
 
 
 
-        v_Interval_index = getVowelInterval(tg, phone_Tier, phone_xmins, time, lo = last_v_Interval)
+        v_Interval_index, w_Interval_Index, context, pre_Seg, post_Seg, post2_Seg = getTokenContext(tg, phone_Tier, word_Tier, phone_xmins, word_xmins, time, lo = last_v_Interval)
         last_Interval = v_Interval_index
-        
-        pre_Interval_index = v_Interval_index - 1
-        post_Interval_index = v_Interval_index + 1
-        post2_Interval_index = v_Interval_index + 2
-
-        pre_Seg = tg[phone_Tier][pre_Interval_index].mark()
-        post_Seg = tg[phone_Tier][post_Interval_index].mark()
-        post2_Seg = tg[phone_Tier][post2_Interval_index].mark()
-
-
-
-        phone_Interval = tg[phone_Tier][v_Interval_index]
-
-        w_Interval_Index = getIntervalAtTime(word_xmins, phone_Interval.xmin()+0.001)
-
-        
-        word_Interval = tg[word_Tier][w_Interval_Index]
-
-        context = getWordContext(word_Interval, phone_Interval)
 
-        word_Trans = getWordTranscription(tg, word_Tier, phone_Tier, w_Interval_Index)
-        post_word_Trans = getWordTranscription(tg, word_Tier, phone_Tier, w_Interval_Index+1)
+        word_Trans, post_word_Trans = getTokenTranscriptions(tg, word_Tier, phone_Tier, w_Interval_Index)
 
-        writeContextInfo(path, spinfo, line, context, pre_Seg, post_Seg, post2_Seg, word_Trans, post_word_Trans)   
+        writeContextInfo(path, spinfo, tokens, i, context, pre_Seg, post_Seg, post2_Seg, word_Trans, post_word_Trans)   
 
 
 ######################
 ##  Main Program
 ######################
 
-parser = optparse.OptionParser()
-parser.add_option("-m", "--multiple", action = "store_true", default = False, dest = "multiple")
-parser.add_option("-s", "--savepath", action = "store", dest = "savepath")
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option("-m", "--multiple", action = "store_true", default = False, dest = "multiple")
+    parser.add_option("-s", "--savepath", action = "store", dest = "savepath")
 
-(options, args) = parser.parse_args()
+    (options, args) = parser.parse_args()
 
-if options.multiple:
-    tgfile_mult = open(args[0])
-    pltfile_mult = open(args[1])
+    if options.multiple:
+        tgfile_mult = open(args[0])
+        pltfile_mult = open(args[1])
 
-    while tgfile_mult:
-        tgfile = tgfile_mult.readline().rstrip()
-        if tgfile == "":
-            break
-        pltfile = pltfile_mult.readline().rstrip()
+        while tgfile_mult:
+            tgfile = tgfile_mult.readline().rstrip()
+            if tgfile == "":
+                break
+            pltfile = pltfile_mult.readline().rstrip()
 
-        getContext(tgfile, pltfile, options.savepath)
+            getContext(tgfile, pltfile, options.savepath)
 
-        
-else:
-    tgfile = args[0]
-    pltfile = args[1]
 
-    getContext(tgfile, pltfile, options.savepath)
-    
+    else:
+        tgfile = args[0]
+        pltfile = args[1]
+
+        getContext(tgfile, pltfile, options.savepath)
+
 
 
 
@@ -0,0 +1,293 @@
+"""
+Normalizes F1 and F2 across many speakers at once.
+
+Input is either remeasure.py output (one speaker per file, identified by
+the speaker info line at the top of the file) or a columnar file written
+by plotnik.py (speakers identified by the spinfo columns V7, V8 ...).
+Per speaker sums are gathered for every input with grouped reductions
+(numpy.bincount) before anything is written, so only the per speaker
+statistics are kept across files. Columnar inputs are memory mapped and
+read, and their normalized columns computed and written, a block of rows
+at a time, so a corpus wide file is never held in memory whole; remeasure.py
+files hold one speaker each and are read whole. Each input is then written
+back out with normalized columns such as F1_lobanov added after the originals.
+
+Methods:
+    lobanov  (F - speaker mean) / speaker sd, per formant
+    nearey1  log(F) - speaker mean of log(F), per formant
+    nearey2  log(F) - speaker mean of log(F) pooled over the formants
+
+Usage:
+    python normalize.py [-m lobanov,nearey1] [-f F1,F2] [-s savepath] speaker1.txt speaker2.txt ...
+    python normalize.py corpus.col
+"""
+
+import optparse
+import os
+import sys
+
+import numpy
+
+import columnfile
+
+
+METHODS = ["lobanov", "nearey1", "nearey2"]
+REMEASURE_SKIP = 3
+
+
+class SpeakerStats(object):
+    """
+    Per speaker counts, sums and sums of squares of each formant and of its log.
+    Arrays have one row per speaker and one column per formant.
+    """
+
+    def __init__(self, formants):
+        self.formants = list(formants)
+        self.speakers = []
+        self.index = {}
+        k = len(self.formants)
+        self.n = numpy.zeros((0, k))
+        self.sum = numpy.zeros((0, k))
+        self.sumsq = numpy.zeros((0, k))
+        self.logn = numpy.zeros((0, k))
+        self.logsum = numpy.zeros((0, k))
+
+    def __len__(self):
+        return(len(self.speakers))
+
+    def speakerCodes(self, codes, levels):
+        """Maps codes against a list of speaker labels onto speaker rows, adding new speakers"""
+        codes, self.speakers, self.index = columnfile.recode(codes, levels, self.speakers, self.index)
+        grow = len(self.speakers) - self.n.shape[0]
+        if grow > 0:
+            k = len(self.formants)
+            for name in ["n", "sum", "sumsq", "logn", "logsum"]:
+                setattr(self, name, numpy.vstack([getattr(self, name), numpy.zeros((grow, k))]))
+        return(codes)
+
+    def add(self, speakers, values):
+        """
+        Adds tokens to the sums. speakers holds the speaker row of each token
+        and values is a (tokens x formants) array; NaNs are left out.
+        """
+        nspeakers = len(self.speakers)
+        for j in range(len(self.formants)):
+            x = values[:, j]
+            ok = numpy.isfinite(x)
+            s = speakers[ok]
+            x = x[ok]
+            self.n[:, j] += numpy.bincount(s, minlength = nspeakers)
+            self.sum[:, j] += numpy.bincount(s, weights = x, minlength = nspeakers)
+            self.sumsq[:, j] += numpy.bincount(s, weights = x * x, minlength = nspeakers)
+            pos = x > 0
+            self.logn[:, j] += numpy.bincount(s[pos], minlength = nspeakers)
+            self.logsum[:, j] += numpy.bincount(s[pos], weights = numpy.log(x[pos]), minlength = nspeakers)
+
+    def normalize(self, method, speakers, values):
+        """Returns a (tokens x formants) array of values normalized by method"""
+        with numpy.errstate(divide = "ignore", invalid = "ignore"):
+            if method == "lobanov":
+                mean = self.sum / self.n
+                sd = numpy.sqrt((self.sumsq - self.n * mean * mean) / (self.n - 1))
+                return((values - mean[speakers]) / sd[speakers])
+            if method == "nearey1":
+                logmean = self.logsum / self.logn
+                return(numpy.log(values) - logmean[speakers])
+            if method == "nearey2":
+                logmean = self.logsum.sum(axis = 1) / self.logn.sum(axis = 1)
+                return(numpy.log(values) - logmean[speakers][:, numpy.newaxis])
+        raise ValueError("unknown normalization method %s" % method)
+
+
+def isColumnFile(file):
+    """Tests whether a file was written by columnfile.writeColumns"""
+    f = open(file, "rb")
+    magic = f.read(len(columnfile.MAGIC))
+    f.close()
+    return(magic == columnfile.MAGIC.encode("utf-8"))
+
+
+def readRemeasureHeader(file):
+    """Returns the speaker line, the lines before the column names, and the column names of remeasure.py output"""
+    f = open(file)
+    head = [f.readline() for i in range(REMEASURE_SKIP)]
+    names = f.readline().rstrip("\n").split("\t")
+    f.close()
+    return(head[0].rstrip("\n"), head, names)
+
+
+def readRemeasureValues(file, formants):
+    """Reads the formant columns of remeasure.py output as a (tokens x formants) array"""
+    speaker, head, names = readRemeasureHeader(file)
+    cols = [names.index(formant) for formant in formants]
+    values = numpy.genfromtxt(file, delimiter = "\t", skip_header = REMEASURE_SKIP + 1,
+                              usecols = cols, ndmin = 2)
+    return(speaker, values)
+
+
+def columnSpeakers(columns, a, b):
+    """
+    Returns speaker codes and labels for rows a to b of a columnar file, from its
+    spinfo columns (V7, V8 ...) or from File where there are none.
+    """
+    spinfo = [c for c in columns if c.name[0] == "V" and c.name[1:].isdigit()]
+    if not spinfo:
+        spinfo = [c for c in columns if c.name == "File"]
+    codes = numpy.vstack([numpy.asarray(c.values[a:b]) for c in spinfo]).T
+    unique, inverse = numpy.unique(codes, axis = 0, return_inverse = True)
+    labels = []
+    for row in unique:
+        labels.append(",".join([c.levels[code] if code >= 0 else "NA" for c, code in zip(spinfo, row)]))
+    return(inverse.reshape(-1).astype(numpy.int32), labels)
+
+
+def columnValues(columns, formants, a, b):
+    """Returns rows a to b of the formant columns of a columnar file as a (tokens x formants) array"""
+    byname = dict((c.name, c) for c in columns)
+    return(numpy.column_stack([byname[formant].values[a:b] for formant in formants]))
+
+
+def blocks(columns):
+    """The (start, end) row ranges a columnar file is processed in"""
+    nrow = len(columns[0]) if columns else 0
+    return([(a, min(a + columnfile.BLOCKROWS, nrow)) for a in range(0, nrow, columnfile.BLOCKROWS)])
+
+
+def outputPath(file, savepath):
+    """Names the output for an input file, adding -norm before the extension"""
+    dirname, name = os.path.split(file)
+    base, ext = os.path.splitext(name)
+    if savepath is None:
+        savepath = dirname
+    return(os.path.join(savepath, base + "-norm" + ext))
+
+
+def gatherStats(files, formants):
+    """First pass: accumulates the per speaker sums of every input"""
+    stats = SpeakerStats(formants)
+    for file in files:
+        sys.stderr.write("Reading %s\n" % file)
+        if isColumnFile(file):
+            columns = columnfile.readColumns(file, mmap = True)
+            for a, b in blocks(columns):
+                codes, labels = columnSpeakers(columns, a, b)
+                stats.add(stats.speakerCodes(codes, labels), columnValues(columns, formants, a, b))
+        else:
+            speaker, values = readRemeasureValues(file, formants)
+            codes, labels = numpy.zeros(len(values), dtype = numpy.int32), [speaker]
+            stats.add(stats.speakerCodes(codes, labels), values)
+    return(stats)
+
+
+def formatNormalized(value):
+    """Formats a normalized value for remeasure style output"""
+    if numpy.isfinite(value):
+        return(repr(float(value)))
+    return("NA")
+
+
+def normalizedNames(formants, methods):
+    """Names the normalized columns, such as F1_lobanov"""
+    names = []
+    for method in methods:
+        names.extend(["%s_%s" % (formant, method) for formant in formants])
+    return(names)
+
+
+def normalizedValues(stats, methods, speakers, values):
+    """Returns a (tokens x formants*methods) array of normalized values"""
+    return(numpy.column_stack([stats.normalize(method, speakers, values) for method in methods]))
+
+
+class NormalizedBlocks(object):
+    """
+    The normalized values of a columnar file, computed one block of rows at a time.
+    The last block is kept, since writeColumns asks for each normalized column of a block in turn.
+    """
+
+    def __init__(self, columns, stats, formants, methods):
+        self.columns = columns
+        self.stats = stats
+        self.formants = formants
+        self.methods = methods
+        self.nrow = len(columns[0])
+        self.rows = None
+        self.normed = None
+
+    def block(self, a, b):
+        if self.rows != (a, b):
+            codes, labels = columnSpeakers(self.columns, a, b)
+            speakers = self.stats.speakerCodes(codes, labels)
+            self.normed = normalizedValues(self.stats, self.methods, speakers, columnValues(self.columns, self.formants, a, b))
+            self.rows = (a, b)
+        return(self.normed)
+
+
+class NormalizedColumn(object):
+    """One normalized column of a NormalizedBlocks, sliced as writeColumns asks for it"""
+
+    def __init__(self, blocks, j):
+        self.blocks = blocks
+        self.j = j
+
+    def __len__(self):
+        return(self.blocks.nrow)
+
+    def __getitem__(self, key):
+        a, b, step = key.indices(self.blocks.nrow)
+        return(self.blocks.block(a, b)[:, self.j])
+
+
+def writeNormalized(file, path, stats, formants, methods):
+    """Second pass: writes one input back out with the normalized columns added"""
+    if isColumnFile(file):
+        columns = columnfile.readColumns(file, mmap = True)
+        normed = NormalizedBlocks(columns, stats, formants, methods)
+        for j, name in enumerate(normalizedNames(formants, methods)):
+            columns.append(columnfile.Column(name, columnfile.DOUBLE, NormalizedColumn(normed, j)))
+        columnfile.writeColumns(path, columns)
+        return
+
+    speaker, head, names = readRemeasureHeader(file)
+    speaker, values = readRemeasureValues(file, formants)
+    speakers = stats.speakerCodes(numpy.zeros(len(values), dtype = numpy.int32), [speaker])
+    normed = normalizedValues(stats, methods, speakers, values)
+
+    f = open(file)
+    out = open(path, "w")
+    for line in head:
+        out.write(line)
+    out.write("\t".join(names + normalizedNames(formants, methods)) + "\n")
+    for j in range(REMEASURE_SKIP + 1):
+        f.readline()
+    i = 0
+    for line in f:
+        line = line.rstrip("\n")
+        if line == "":
+            continue
+        out.write(line + "\t" + "\t".join([formatNormalized(x) for x in normed[i]]) + "\n")
+        i = i + 1
+    f.close()
+    out.close()
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option("-m", "--methods", action = "store", default = "lobanov", dest = "methods")
+    parser.add_option("-f", "--formants", action = "store", default = "F1,F2", dest = "formants")
+    parser.add_option("-s", "--savepath", action = "store", dest = "savepath")
+
+    (options, args) = parser.parse_args()
+    methods = options.methods.split(",")
+    formants = options.formants.split(",")
+    for method in methods:
+        if method not in METHODS:
+            parser.error("unknown normalization method %s" % method)
+
+    stats = gatherStats(args, formants)
+    sys.stderr.write("%d speakers\n" % len(stats))
+
+    for file in args:
+        path = outputPath(file, options.savepath)
+        writeNormalized(file, path, stats, formants, methods)
+        sys.stderr.write("Wrote %s\n" % path)
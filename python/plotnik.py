@@ -0,0 +1,244 @@
+"""
+Reads plotnik .plt files in bulk, decoding them into the same columns as
+r/read.plotnik.R, and writes them out as a single typed columnar file that
+R loads with read.columns() from r/read.columns.R.
+
+The vowel class and environment codes are decoded once per distinct
+VCoding in a file, and the decoded labels are mapped onto the tokens
+with array lookups rather than row by row.
+
+Usage:
+    python plotnik.py -o corpus.col speakers/ [more.plt ...]
+"""
+
+import optparse
+import os
+import sys
+
+import numpy
+
+import columnfile
+import tokentable
+
+
+VCLASS_CODES = {
+    "1" : "i",
+    "2" : "e",
+    "3" : "ae",
+    "5" : "o",
+    "6" : "uh",
+    "7" : "u",
+    "*" : "*",
+    "11" : "iy",
+    "12" : "iyF",
+    "21" : "ey",
+    "22" : "eyF",
+    "41" : "ay",
+    "47" : "ay0",
+    "61" : "oy",
+    "42" : "aw",
+    "62" : "ow",
+    "63" : "owF",
+    "72" : "uw",
+    "73" : "Tuw",
+    "82" : "iw",
+    "33" : "aeh",
+    "39" : "aeBR",
+    "43" : "ah",
+    "53" : "oh",
+    "14" : "iyr",
+    "24" : "eyr",
+    "44" : "ahr",
+    "54" : "ohr",
+    "64" : "owr",
+    "74" : "uwr",
+    "94" : "*hr"
+    }
+
+MANNER_CODES = {
+    "1" : "stop",
+    "2" : "affricate",
+    "3" : "fricative",
+    "4" : "nasal",
+    "5" : "lateral",
+    "6" : "central"
+    }
+
+PLACE_CODES = {
+    "1" : "labial",
+    "2" : "labiodental",
+    "3" : "interdental",
+    "4" : "apical",
+    "5" : "palatal",
+    "6" : "velar"
+    }
+
+VOICE_CODES = {
+    "1" : "voiceless",
+    "2" : "voiced"
+    }
+
+PRESEG_CODES = {
+    "1" : "oral labial",
+    "2" : "nasal labial",
+    "3" : "oral apical",
+    "4" : "nasal apical",
+    "5" : "palatal",
+    "6" : "velar",
+    "7" : "liquid",
+    "8" : "obstruent liquid",
+    "9" : "w/y"
+    }
+
+FOLSEQ_CODES = {
+    "1" : "one_fol_syll",
+    "2" : "two_fol_syl",
+    "3" : "complex_coda",
+    "4" : "complex_one_syl",
+    "5" : "complex_two_syl"
+    }
+
+ENV_NAMES = ["Manner", "Place", "Voice", "PreSeg", "FolSeq"]
+ENV_CODES = [MANNER_CODES, PLACE_CODES, VOICE_CODES, PRESEG_CODES, FOLSEQ_CODES]
+
+
+def decodeVCoding(vcoding, dotted):
+    """
+    Decodes a plotnik vowel coding such as 21.41235 into
+    [VClass, Manner, Place, Voice, PreSeg, FolSeq], with None for unknown codes.
+    dotted says whether any coding in the file had environment codes;
+    as in read.plotnik.R, short environments are padded with 0s.
+    """
+    if dotted:
+        vclass = vcoding.split(".")[0]
+        env = vcoding.split(".")[-1]
+        while len(env) < 5:
+            env = env + "0"
+    else:
+        vclass = vcoding
+        env = "00000"
+
+    labels = [VCLASS_CODES.get(vclass)]
+    for digit, codes in zip(env, ENV_CODES):
+        labels.append(codes.get(digit))
+    return(labels)
+
+
+def parseNumber(value):
+    """Converts a field to a float, returning NaN where R's as.numeric would give NA"""
+    try:
+        return(float(value))
+    except ValueError:
+        return(numpy.nan)
+
+
+def pltFiles(paths):
+    """Expands directories into the .plt files they contain"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".plt"):
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return(files)
+
+
+class PlotnikColumns(object):
+    """
+    Collects the decoded columns of many .plt files.
+    """
+
+    def __init__(self):
+        self.builders = {}
+        self.order = []
+        self.nrow = 0
+
+    def builder(self, name, type):
+        """Returns the builder for a column, creating it (NA filled so far) if needed"""
+        if name not in self.builders:
+            self.builders[name] = columnfile.ColumnBuilder(name, type, self.nrow)
+            self.order.append(name)
+        return(self.builders[name])
+
+    def addFile(self, file):
+        """Reads and decodes one .plt file"""
+        spinfo, table = tokentable.loadPlt(file)
+        n = len(table)
+
+        for name in tokentable.PLT_NUMERIC:
+            self.builder(name, columnfile.DOUBLE).addValues(numpy.array(table.columns[name], dtype = float))
+
+        vcodes, vlevels = table.codes("VCoding")
+        vcodes = numpy.array(vcodes, dtype = numpy.int32)
+        self.builder("VCoding", columnfile.CHARACTER).addCodes(vcodes, vlevels)
+
+        dscodes, dslevels, dsindex = columnfile.intern(table.values("Dur_Stress"))
+        self.builder("Dur_Stress", columnfile.CHARACTER).addCodes(dscodes, dslevels)
+
+        info = table.values("Info")
+        self.builder("Info", columnfile.CHARACTER).addLabels(info)
+
+        for i, value in enumerate(spinfo):
+            self.builder("V%d" % (i + 7), columnfile.CHARACTER).addCodes(numpy.zeros(n, dtype = numpy.int32), [value])
+
+        wcodes, wlevels = table.codes("Word")
+        self.builder("Word", columnfile.FACTOR).addCodes(numpy.array(wcodes, dtype = numpy.int32), wlevels)
+
+        if any(["." in level for level in dslevels]):
+            stress = [level.split(".")[0] for level in dslevels]
+            dur = numpy.array([parseNumber(level.split(".")[1]) if "." in level else numpy.nan
+                               for level in dslevels])
+            self.builder("Stress", columnfile.FACTOR).addCodes(dscodes, stress)
+            self.builder("Dur_msec", columnfile.DOUBLE).addValues(dur[dscodes])
+        else:
+            self.builder("Stress", columnfile.FACTOR).addCodes(dscodes, dslevels)
+
+        dotted = any(["." in level for level in vlevels])
+        decoded = [decodeVCoding(level, dotted) for level in vlevels]
+        for j, name in enumerate(["VClass"] + ENV_NAMES):
+            self.builder(name, columnfile.FACTOR).addCodes(vcodes, [labels[j] for labels in decoded])
+
+        function = numpy.array(["[f]" in x for x in info], dtype = numpy.int32)
+        if function.any():
+            self.builder("Function", columnfile.LOGICAL).addValues(function)
+
+        self.builder("File", columnfile.CHARACTER).addCodes(numpy.zeros(n, dtype = numpy.int32),
+                                                            [os.path.basename(file)])
+
+        self.nrow = self.nrow + n
+        for name in self.order:
+            self.builders[name].pad(self.nrow)
+
+    def columns(self):
+        """
+        Returns the Columns in read.plotnik.R's order:
+        the plotnik fields, the speaker info, then the decoded columns.
+        """
+        first = ["F1", "F2", "F3", "VCoding", "Dur_Stress", "Info"]
+        last = ["Word", "Stress", "Dur_msec", "VClass"] + ENV_NAMES + ["Function", "File"]
+        spinfo = [name for name in self.order if name not in first and name not in last]
+        spinfo.sort(key = lambda name: int(name[1:]))
+        names = [name for name in first + spinfo + last if name in self.builders]
+        return([self.builders[name].column() for name in names])
+
+
+def readPlotnik(paths):
+    """Reads and decodes .plt files and directories of .plt files, returning a list of Columns"""
+    collected = PlotnikColumns()
+    for file in pltFiles(paths):
+        sys.stderr.write("Reading %s\n" % file)
+        collected.addFile(file)
+    return(collected.columns())
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option("-o", "--output", action = "store", default = "plotnik.col", dest = "output")
+
+    (options, args) = parser.parse_args()
+
+    columns = readPlotnik(args)
+    columnfile.writeColumns(options.output, columns)
+    sys.stderr.write("Wrote %d tokens to %s\n" % (len(columns[0]) if columns else 0, options.output))
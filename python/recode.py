@@ -217,9 +217,11 @@ def defSyl(syl,n):
     sylinfo = [vowel,str(nfollowing),coda,final,folseg,onset,preseg,thisseg[0],thisseg[1],thisseg[2]]
     return sylinfo
 
-def cmutrans(word, cmu):
+def cmutrans(word, cmu, vowel = "", ask = True):
     if word in cmu:
         trans = cmu[word]
+    elif not ask:
+        trans = None
     else:
         sys.stderr.write("Please transcribe "+word+" "+vowel+"\n")
         trans = sys.stdin.readline().rstrip().upper()
@@ -314,76 +316,93 @@ def findsyl(index, syls):
 import re
 import string
 import sys
+import tokentable
 
-args = sys.argv
-#sys.stderr.write(string.join(args, sep = "\n"))
-tocode = sys.argv[1]
-wordindex = int(sys.argv[2])-1
-vowelindex = int(sys.argv[3])-1
-transindex = sys.argv[4]
-sylindex = sys.argv[5]
-
-if len(transindex) > 2:
-    cmu = readcmu(transindex)
-    transindex = "cmu"
-else:
-    transindex = int(transindex) - 1
-    
-form = open(tocode)
-#form = open("../anaeformants-clean.txt")
-dig  = re.compile("\d")
-header = form.readline().rstrip()
-
-#sylinfo = [vowel,str(nfollowing),coda,final,folseg,onset,preseg,thisseg[0],thisseg[1],thisseg[2]]
-features = "\tVowel2\tFolSyl\tCoda\tFinal\tFolSeg\tOnset\tPreSeg\tPlace\tVoice\tManner"
-
-sys.stdout.write(header+features+"\n")
-for line in form:
-    line = line.rstrip()
-    if len(line) < 1:
-       
-        break
-    line = line.split("\t")
-    #vowel = "AY"
+def recodeFile(tocode, wordindex, vowelindex, transindex, sylindex, cmu = None, ask = True):
+    """
+    Writes tocode to stdout with syllable information appended to each line.
+    transindex is "cmu" to look words up in the cmu dictionary, or the index of a transcription column.
+    """
+    header, table = tokentable.loadDelimited(tocode, categorical = [wordindex, vowelindex], keepLines = True)
+    #header, table = tokentable.loadDelimited("../anaeformants-clean.txt", categorical = [wordindex, vowelindex])
+    wordcol = table.names[wordindex]
+    vowelcol = table.names[vowelindex]
+    notinword= re.compile("[\d()]")
+
+    #sylinfo = [vowel,str(nfollowing),coda,final,folseg,onset,preseg,thisseg[0],thisseg[1],thisseg[2]]
+    features = "\tVowel2\tFolSyl\tCoda\tFinal\tFolSeg\tOnset\tPreSeg\tPlace\tVoice\tManner"
+
+    sys.stdout.write(header+features+"\n")
+    for i in range(len(table)):
+        #vowel = "AY"
     
 
-    word = line[wordindex]
-    vowel = line[vowelindex]
-    notinword= re.compile("[\d()]")
-    word = notinword.sub("",word).upper()
+        word = table.get(wordcol, i)
+        vowel = table.get(vowelcol, i)
+        word = notinword.sub("",word).upper()
     
-    syls = []
-    if transindex == "cmu":
-        trans = cmutrans(word, cmu)
-        if trans is not None:
-            syls = syllabify(trans)
+        syls = []
+        if transindex == "cmu":
+            trans = cmutrans(word, cmu, vowel, ask)
+            if trans is not None:
+                ## syllabify edits the transcription, so the dictionary entry is copied
+                syls = syllabify(list(trans))
+            else:
+                syls = None
         else:
-            syls = None
-    else:
-        trans = line[transindex].split(" ")
-        syls = syllabify(trans)        
+            trans = table.get(table.names[transindex], i).split(" ")
+            syls = syllabify(trans)        
 
 
-    if sylindex == "guess":
-        if trans is not None:
-            syl,matched = guesssyl(vowel, syls)
+        if sylindex == "guess":
+            if trans is not None:
+                syl,matched = guesssyl(vowel, syls)
+            else:
+                syl = 0
+                matched = 0
         else:
-            syl = 0
-            matched = 0
-    else:
-        index = int(line[int(sylindex)-1])
-        syl = findsyl(index, syls)
+            index = int(table.get(table.names[int(sylindex)-1], i))
+            syl = findsyl(index, syls)
        
         
 
-    if trans is not None:
-        sylinfo = defSyl(syls,syl)
-    else:
-        sylinfo = ["","","","","","","","","",""]
+        if trans is not None:
+            sylinfo = defSyl(syls,syl)
+        else:
+            sylinfo = ["","","","","","","","","",""]
         
-    line = string.join(line, "\t")
-    sylinfo = string.join(sylinfo,"\t")
-    sys.stdout.write(line+"\t"+sylinfo+"\n")
+        line = table.lines[i]
+        sylinfo = string.join(sylinfo,"\t")
+        sys.stdout.write(line+"\t"+sylinfo+"\n")
+
+
+def parseArgs(args):
+    """Converts recode.py's command line arguments into recodeFile arguments, and the cmu dictionary file if any"""
+    tocode = args[0]
+    wordindex = int(args[1])-1
+    vowelindex = int(args[2])-1
+    transindex = args[3]
+    sylindex = args[4]
+    cmufile = None
+
+    if len(transindex) > 2:
+        cmufile = transindex
+        transindex = "cmu"
+    else:
+        transindex = int(transindex) - 1
+    return(tocode, wordindex, vowelindex, transindex, sylindex, cmufile)
+
+
+if __name__ == "__main__":
+    args = sys.argv
+    #sys.stderr.write(string.join(args, sep = "\n"))
+    tocode, wordindex, vowelindex, transindex, sylindex, cmufile = parseArgs(sys.argv[1:])
+
+    cmu = None
+    if cmufile is not None:
+        cmu = readcmu(cmufile)
+
+    recodeFile(tocode, wordindex, vowelindex, transindex, sylindex, cmu)
 
  
     
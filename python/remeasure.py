@@ -1,56 +1,36 @@
 import ast
 import math
+import optparse
 import rpy2.robjects as robjects
 import rpy2.rinterface as rinterface
 import sys
 import string
+import tokentable
+import vowelstats
+
+
+## Vowel classes with fewer tokens than this are not remeasured from the speaker's own model
+MINTOKENS = 7
 
 
 def loadfile(file):
     """
-    Loads an extractFormants file. Returns formatted list of lists.
+    Loads an extractFormants file. Returns a TokenTable.
     """
-    f = open(file)
-    sys.stdout.write(f.readline())
-    f.readline()
-    f.readline()
     sys.stderr.write("Reading file...")
-    lines = f.readlines()
-    f.close()
-    lines = [line.rstrip().split("\t") for line in lines]
+    header, table = tokentable.loadFormants(file)
+    sys.stdout.write(header)
     sys.stderr.write("File read\n")
-    return lines
+    return table
 
 
-def createVowelDictionary(lines, vowelindex):
+def createVowelDictionary(table, vowelcol):
     """
     Creates a dictionary of F1, F2, B1, B3 and Duration observations by vowel type.
-    vowel index indicates the index in lines[x] which should be taken as identifying vowel categories.
+    vowelcol names the column of the table which should be taken as identifying vowel categories.
     """
-    vowels = {}
     sys.stderr.write("Creating vowel dictionary...")
-
-    for line in lines:
-        vowel = line[vowelindex]
-        F1 = float(line[3])
-        F2 = float(line[4])
-#        if line[5] != "":
-#            F3 = float(line[5])
-#        else
-        B1 = math.log(float(line[6]))
-        B2 = math.log(float(line[7]))
-#        B3 = math.log(float(line[8]))
-        Dur = math.log(float(line[12]))
-        
-
-    
-        if vowel in vowels:
-#            vowels[vowel].append([F1, F2,F3,  B1, B2, B3, Dur])
-            vowels[vowel].append([F1, F2,  B1, B2, Dur])
-        else:
-#            vowels[vowel] = [[F1, F2, F3, B1, B2, B3, Dur]]
-            vowels[vowel] = [[F1, F2, B1, B2, Dur]]
-
+    vowels = vowelstats.vowelFeatures(table, vowelcol)
     sys.stderr.write("Vowel dictionary created\n")
     return vowels
 
@@ -122,15 +102,69 @@ def calculateVowelMeans(vowels):
     return vowelMeans, vowelCovs
 
 
+def estimateModels(vowels, sample = None, seed = 0):
+    """
+    Calculates the vowel means and covariance matrices, excluding outliers.
+    If sample is given, each vowel class is estimated from a seeded reservoir sample of at most that many tokens.
+    sample must be at least MINTOKENS, or a class used for remeasuring could get a singular covariance matrix.
+    """
+    if sample is not None and sample < MINTOKENS:
+        raise ValueError("the sample size must be at least %d tokens" % MINTOKENS)
+    if sample is not None:
+        vowels = vowelstats.sampleVowels(vowels, sample, seed)
+    vowelMeans, vowelCovs = calculateVowelMeans(vowels)
+    invowels = excludeOutliers(vowels, vowelMeans, vowelCovs)
+    return calculateVowelMeans(invowels)
+
+
+def compareModels(vowels, sample, vowelMeans, vowelCovs, fullMeans, fullCovs):
+    """
+    Reports how far models estimated from samples of at most sample tokens are from those estimated from every token.
+    For each sampled vowel class it writes the Mahalanobis distance of the sampled mean under the full model,
+    and the largest relative difference between the sampled and full standard deviations.
+    """
+    sys.stderr.write("vowel\ttokens\tsampled\tmeanDist\tmaxSdDiff\n")
+    for vowel in sorted(vowels.keys()):
+        if len(vowels[vowel]) <= sample or fullCovs[vowel][0] is rinterface.NA_Real:
+            continue
+        dist = math.sqrt(robjects.r['mahalanobis'](vowelMeans[vowel], fullMeans[vowel], fullCovs[vowel])[0])
+        sds = list(robjects.r['diag'](vowelCovs[vowel]))
+        fullsds = list(robjects.r['diag'](fullCovs[vowel]))
+        sddiff = max([abs(math.sqrt(a / b) - 1) for a, b in zip(sds, fullsds)])
+        sys.stderr.write("%s\t%d\t%d\t%.4f\t%.4f\n" % (vowel, len(vowels[vowel]), sample, dist, sddiff))
+
+
 
 
 
     
 
-def repredictF1F2(lines,vowelindex, vowelMeans, vowelCovs,vowels):
+def priorModels(stats):
+    """
+    Converts corpus wide vowel statistics from vowelstats.py into R means and covariance matrices,
+    for vowel classes with enough tokens to estimate a covariance matrix.
+    """
+    priorMeans = {}
+    priorCovs = {}
+    for vowel in stats.vowels():
+        k = len(stats.features)
+        if stats.count(vowel) <= k:
+            continue
+        cov = stats.covariance(vowel)
+        priorMeans[vowel] = robjects.FloatVector(stats.mean(vowel))
+        priorCovs[vowel] = robjects.r["matrix"](robjects.FloatVector([cov[a][b] for b in range(k) for a in range(k)]), ncol = k)
+    return priorMeans, priorCovs
+
+
+def repredictF1F2(table, vowelcol, vowelMeans, vowelCovs,vowels, priorMeans = None, priorCovs = None):
     """
     Predicts F1 and F2 from the speaker's own vowel distributions based on the mahalanobis distance.
+    Vowel classes the speaker has too few tokens of use priorMeans and priorCovs, if given,
+    and otherwise keep their original measurements.
     """
+    if priorCovs is None:
+        priorMeans = {}
+        priorCovs = {}
     sys.stderr.write("Finding best measurements...")
     #sys.stdout.write("\n\nCMUVowel\tVowel\tStress\tWord\tbeg\tend\tdur\tOriginalF1\tOriginalF2\tOriginalF3\tOriginalB1\tOriginalB2\tOriginalB3\tfm\tfp\tfv\tps\tfs\tF1\tF2\tlogB1\tlogB2\tlogDur\n")
     colnames = ["CMUVowel",
@@ -168,25 +202,22 @@ def repredictF1F2(lines,vowelindex, vowelMeans, vowelCovs,vowels):
     colnamesstring = string.join(colnames, "\t")
     sys.stdout.write("\n\n"+colnamesstring+"\n")
     
-    for line in lines:
-        CMUvowel = line[0]
-        vowel= line[vowelindex]
-        stress = line[1]
-        word = line[2]
-        t = line[9]
-        beg = line[10]
-        end = line[11]
-        Dur = line[12]
-        F1orig = line[3]
-        F2orig = line[4]
-        F3orig = line[5]
-        B1orig = line[6]
-        B2orig = line[7]
-        B3orig = line[8]
-        lDur = math.log(float(Dur))
-        
-        poles = ast.literal_eval(line[21])
-        bandwidths = ast.literal_eval(line[22])
+    infocols = ["cd", "fm", "fp", "fv", "ps", "fs", "style", "glide"]
+    origcols = ["t", "beg", "end", "dur", "F1", "F2", "F3", "B1", "B2", "B3"]
+
+    for j in range(len(table)):
+        CMUvowel = table.get("CMUVowel", j)
+        vowel = table.get(vowelcol, j)
+        stress = table.get("Stress", j)
+        word = table.get("Word", j)
+        t, beg, end, Dur, F1orig, F2orig, F3orig, B1orig, B2orig, B3orig = table.row(j, origcols)
+        lDur = math.log(table.columns["dur"][j])
+        origvalues = [table.columns["F1"][j], table.columns["F2"][j], table.columns["F2"][j],
+                      math.log(table.columns["B1"][j]), math.log(table.columns["B2"][j]), math.log(table.columns["B3"][j]),
+                      lDur]
+
+        poles = ast.literal_eval(table.get("poles", j))
+        bandwidths = ast.literal_eval(table.get("bandwidths", j))
 
         valuesList = []
         distanceList = []
@@ -218,23 +249,20 @@ def repredictF1F2(lines,vowelindex, vowelMeans, vowelCovs,vowels):
                 ##If there is only one member of a vowel category,
                 ##the covariance matrix will be filled with NAs
                 #sys.stderr.write(vowel+"\n")
-                if vowel in vowelCovs:
-                    if vowelCovs[vowel][0] is rinterface.NA_Real:
-                        valuesList.append([float(F1orig), float(F2orig), float(F2orig), math.log(float(B1orig)), math.log(float(B2orig)), math.log(float(B3orig)),lDur])
-                        distanceList.append(0)
-                        nFormantsList.append(nFormants)
-                    elif len(vowels[vowel]) < 7:
-                        valuesList.append([float(F1orig), float(F2orig), float(F2orig), math.log(float(B1orig)), math.log(float(B2orig)), math.log(float(B3orig)),lDur])
-                        distanceList.append(0)
-                        nFormantsList.append(nFormants)
-                    else:
-                        dist = robjects.r['mahalanobis' ](x, vowelMeans[vowel], vowelCovs[vowel])[0]
+                if vowel in vowelCovs and vowelCovs[vowel][0] is not rinterface.NA_Real and len(vowels[vowel]) >= MINTOKENS:
+                    dist = robjects.r['mahalanobis' ](x, vowelMeans[vowel], vowelCovs[vowel])[0]
     
-                        valuesList.append(outvalues)
-                        distanceList.append(dist)
-                        nFormantsList.append(nFormants)
+                    valuesList.append(outvalues)
+                    distanceList.append(dist)
+                    nFormantsList.append(nFormants)
+                elif vowel in priorCovs:
+                    dist = robjects.r['mahalanobis' ](x, priorMeans[vowel], priorCovs[vowel])[0]
+
+                    valuesList.append(outvalues)
+                    distanceList.append(dist)
+                    nFormantsList.append(nFormants)
                 else:
-                    valuesList.append([float(F1orig), float(F2orig), float(F2orig), math.log(float(B1orig)), math.log(float(B2orig)), math.log(float(B3orig)),lDur])
+                    valuesList.append(origvalues)
                     distanceList.append(0)
                     nFormantsList.append(nFormants)
 
@@ -245,7 +273,7 @@ def repredictF1F2(lines,vowelindex, vowelMeans, vowelCovs,vowels):
         bestnFormantsString = repr(bestnFormants)
         bestValuesString = [repr(x) for x in bestValues]
 
-        info = [CMUvowel, vowel, stress, word, t, beg, end, Dur, F1orig, F2orig, F3orig,B1orig, B2orig, B3orig, dist, bestnFormantsString, string.join(line[13:21], "\t")]
+        info = [CMUvowel, vowel, stress, word, t, beg, end, Dur, F1orig, F2orig, F3orig,B1orig, B2orig, B3orig, dist, bestnFormantsString, string.join(table.row(j, infocols), "\t")]
         infoLine = string.join(info, "\t")
         valuesLine = string.join(bestValuesString, "\t")
         
@@ -255,18 +283,106 @@ def repredictF1F2(lines,vowelindex, vowelMeans, vowelCovs,vowels):
     sys.stderr.write("Done!\n")
 
 
-## Main Program Starts Here
-#Define some constants
-#file = "/Users/joseffruehwald/Documents/Classes/Fall_10/misc/FAAV/extractFormants_modified/PH06-2-1-AB-Jean.formants"
-file = sys.argv[1]
-vowelindex = 13
+def remeasureFile(file, vowelcol = "cd", models = None, priors = None, sample = None, seed = 0, compare = False):
+    """
+    Remeasures an extractFormants file, writing the results to stdout.
+    models are the (vowels, vowelMeans, vowelCovs) of an earlier run on the same file;
+    they are calculated when not given, and returned for reuse.
+    priors are corpus wide (priorMeans, priorCovs) from priorModels.
+    sample caps the tokens per vowel class the models are estimated from; every token is still remeasured.
+    With compare, the models are also estimated from every token and the differences reported.
+    """
+    table = loadfile(file)
+    if models is None:
+        vowels = createVowelDictionary(table, vowelcol)
+        vowelMeans, vowelCovs = estimateModels(vowels, sample, seed)
+        if compare and sample is not None:
+            fullMeans, fullCovs = estimateModels(vowels)
+            compareModels(vowels, sample, vowelMeans, vowelCovs, fullMeans, fullCovs)
+        models = (vowels, vowelMeans, vowelCovs)
+
+    vowels, vowelMeans, vowelCovs = models
+    if priors is None:
+        priors = (None, None)
+    repredictF1F2(table, vowelcol, vowelMeans, vowelCovs, vowels, priors[0], priors[1])
+    return(models)
+
+
+def trackModels(vowelMeans, vowelCovs, vowels):
+    """
+    Converts the vowel models to numpy (mean, covariance) pairs over F1, F2, logB1 and logB2
+    for trajectory.py, leaving out the vowels repredictF1F2 would not remeasure.
+    """
+    import numpy
 
-lines = loadfile(file)
-vowels = createVowelDictionary(lines, vowelindex)
-vowelMeans, vowelCovs = calculateVowelMeans(vowels)
+    models = {}
+    for vowel in vowelMeans:
+        if vowelCovs[vowel][0] is rinterface.NA_Real or len(vowels[vowel]) < MINTOKENS:
+            continue
+        mean = numpy.array(list(vowelMeans[vowel]))
+        cov = numpy.array(list(vowelCovs[vowel])).reshape(len(mean), len(mean), order = "F")
+        models[vowel] = (mean[:4], cov[:4, :4])
+    return(models)
 
 
-invowels = excludeOutliers(vowels, vowelMeans, vowelCovs)
-vowelMeans, vowelCovs = calculateVowelMeans(invowels)
+def remeasureTracks(file, trackfiles, jump = 1.0, vowelcol = "CMUVowel", sample = None, seed = 0, compare = False):
+    """
+    Chooses a smooth formant track for each token in tracker.Praat output, writing the frames to stdout.
+    trackfiles are tracker runs over the same tokens with different settings, and the
+    speaker's vowel models come from file. tracker.Praat labels vowels with their CMU
+    vowel, so the models are made by CMUVowel rather than plotnik code.
+    sample, seed and compare are as for remeasureFile.
+    """
+    import tracker
+    import trajectory
+
+    ## only the frames go to stdout, so the speaker header is not echoed as loadfile does
+    sys.stderr.write("Reading file...")
+    header, table = tokentable.loadFormants(file)
+    sys.stderr.write("File read\n")
+    vowels = createVowelDictionary(table, vowelcol)
+    vowelMeans, vowelCovs = estimateModels(vowels, sample, seed)
+    if compare and sample is not None:
+        fullMeans, fullCovs = estimateModels(vowels)
+        compareModels(vowels, sample, vowelMeans, vowelCovs, fullMeans, fullCovs)
+
+    sys.stderr.write("Reading tracks...")
+    candidates = [tracker.loadTracker([trackfile]) for trackfile in trackfiles]
+    sys.stderr.write("Choosing tracks...")
+    choice, dist, cost = trajectory.selectTracks(candidates, trackModels(vowelMeans, vowelCovs, vowels), jump)
+    trajectory.writeTracks(sys.stdout, candidates, choice, dist)
+    sys.stderr.write("Done!\n")
 
-repredictF1F2(lines, vowelindex, vowelMeans, vowelCovs, vowels)
+
+## Main Program Starts Here
+#Define some constants
+#file = "/Users/joseffruehwald/Documents/Classes/Fall_10/misc/FAAV/extractFormants_modified/PH06-2-1-AB-Jean.formants"
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage = "%prog [-k sample] [-t tracks1.txt -t tracks2.txt ...] file.formants")
+    parser.add_option("-t", "--tracks", action = "append", dest = "tracks",
+                      help = "tracker.Praat output, once per candidate setting")
+    parser.add_option("-j", "--jump", action = "store", type = "float", default = 1.0, dest = "jump",
+                      help = "weight of frame to frame jumps against Mahalanobis distance")
+    parser.add_option("-p", "--priors", action = "store", dest = "priors",
+                      help = "corpus vowel statistics from vowelstats.py, for vowels with few tokens; not with -t")
+    parser.add_option("-k", "--sample", action = "store", type = "int", dest = "sample",
+                      help = "estimate vowel models from at most this many tokens per vowel class")
+    parser.add_option("--seed", action = "store", type = "int", default = 0, dest = "seed")
+    parser.add_option("--compare", action = "store_true", default = False, dest = "compare",
+                      help = "report how far the sampled models are from the full ones")
+
+    (options, args) = parser.parse_args()
+    if options.sample is not None and options.sample < MINTOKENS:
+        parser.error("-k must be at least %d" % MINTOKENS)
+    if options.tracks and options.priors is not None:
+        parser.error("-p is not used when choosing tracks with -t")
+    file = args[0]
+
+    if options.tracks:
+        remeasureTracks(file, options.tracks, options.jump, sample = options.sample, seed = options.seed,
+                        compare = options.compare)
+    else:
+        priors = None
+        if options.priors is not None:
+            priors = priorModels(vowelstats.readStats(options.priors))
+        remeasureFile(file, priors = priors, sample = options.sample, seed = options.seed, compare = options.compare)
@@ -0,0 +1,164 @@
+"""
+Generates synthetic P2FA style TextGrids and matching plotnik .plt files,
+for benchmarking getContext.py on interviews of any length.
+
+The TextGrid has a phone tier and a word tier, as P2FA writes them, filled
+with words from a small CMU transcribed lexicon separated by sp pauses.
+Every primary stressed vowel gets a line in the .plt file, measured at its midpoint.
+
+Usage:
+    python synthTextGrid.py [-m minutes] [-r seed] [-s savepath] name
+"""
+
+import optparse
+import os
+import random
+
+
+LEXICON = [
+    ("SAY", ["S", "EY1"]),
+    ("CAT", ["K", "AE1", "T"]),
+    ("THE", ["DH", "AH0"]),
+    ("WATER", ["W", "AO1", "T", "ER0"]),
+    ("HOUSE", ["HH", "AW1", "S"]),
+    ("BOAT", ["B", "OW1", "T"]),
+    ("TIME", ["T", "AY1", "M"]),
+    ("BEET", ["B", "IY1", "T"]),
+    ("BIT", ["B", "IH1", "T"]),
+    ("BET", ["B", "EH1", "T"]),
+    ("BOOK", ["B", "UH1", "K"]),
+    ("BOOT", ["B", "UW1", "T"]),
+    ("BUT", ["B", "AH1", "T"]),
+    ("BOY", ["B", "OY1"]),
+    ("FATHER", ["F", "AA1", "DH", "ER0"]),
+    ("HER", ["HH", "ER1"]),
+    ("AND", ["AH0", "N", "D"]),
+    ("PHILADELPHIA", ["F", "IH2", "L", "AH0", "D", "EH1", "L", "F", "IY0", "AH0"])
+    ]
+
+## Plotnik vowel classes for the stressed CMU vowels
+PLOTNIK_CODES = {
+    "IY" : "11", "IH" : "1", "EY" : "21", "EH" : "2", "AE" : "3",
+    "AY" : "41", "AW" : "42", "AA" : "5", "AO" : "53", "OW" : "62",
+    "OY" : "61", "UH" : "7", "AH" : "6", "UW" : "72", "ER" : "94"
+    }
+
+## Rough formant means for the synthetic measurements
+FORMANTS = {
+    "IY" : (300, 2300), "IH" : (430, 2000), "EY" : (480, 2100), "EH" : (600, 1800), "AE" : (700, 1750),
+    "AY" : (750, 1400), "AW" : (760, 1500), "AA" : (750, 1200), "AO" : (620, 1000), "OW" : (520, 1100),
+    "OY" : (550, 900), "UH" : (460, 1300), "AH" : (620, 1250), "UW" : (350, 1500), "ER" : (500, 1400)
+    }
+
+
+def isVowel(phone):
+    return(phone[0] in "AEIOU")
+
+
+def makeIntervals(minutes, rng):
+    """
+    Returns the phone and word intervals, as [xmin, xmax, text] lists, of about minutes of speech,
+    along with the (word, vowel, stress, xmin, xmax) of every primary stressed vowel.
+    """
+    end = minutes * 60.0
+    phones = []
+    words = []
+    vowels = []
+    t = 0.0
+    while t < end:
+        if rng.random() < 0.2:
+            pause = rng.uniform(0.05, 0.5)
+            phones.append([t, t + pause, "sp"])
+            words.append([t, t + pause, "sp"])
+            t = t + pause
+        word, trans = LEXICON[rng.randrange(len(LEXICON))]
+        wstart = t
+        for phone in trans:
+            if isVowel(phone):
+                dur = rng.uniform(0.06, 0.2)
+            else:
+                dur = rng.uniform(0.03, 0.1)
+            phones.append([t, t + dur, phone])
+            if isVowel(phone) and phone[-1] == "1":
+                vowels.append((word, phone[:-1], phone[-1], t, t + dur))
+            t = t + dur
+        words.append([wstart, t, word])
+
+    ## getContext looks two phones and one word past each vowel
+    for i in range(2):
+        phones.append([t, t + 0.1, "sp"])
+        words.append([t, t + 0.1, "sp"])
+        t = t + 0.1
+    return(phones, words, vowels, t)
+
+
+def writeTier(f, n, name, intervals, xmax):
+    f.write('    item [%d]:\n' % n)
+    f.write('        class = "IntervalTier" \n')
+    f.write('        name = "%s" \n' % name)
+    f.write('        xmin = 0 \n')
+    f.write('        xmax = %r \n' % xmax)
+    f.write('        intervals: size = %d \n' % len(intervals))
+    for i, (xmin, xmax_i, text) in enumerate(intervals):
+        f.write('        intervals [%d]:\n' % (i + 1))
+        f.write('            xmin = %r \n' % xmin)
+        f.write('            xmax = %r \n' % xmax_i)
+        f.write('            text = "%s" \n' % text)
+
+
+def writeTextGrid(path, phones, words, xmax, speaker):
+    """Writes a two tier TextGrid in Praat's long text format"""
+    f = open(path, "w")
+    f.write('File type = "ooTextFile"\n')
+    f.write('Object class = "TextGrid"\n\n')
+    f.write('xmin = 0 \n')
+    f.write('xmax = %r \n' % xmax)
+    f.write('tiers? <exists> \n')
+    f.write('size = 2 \n')
+    f.write('item []: \n')
+    writeTier(f, 1, speaker + " - phone", phones, xmax)
+    writeTier(f, 2, speaker + " - word", words, xmax)
+    f.close()
+
+
+def writePlt(path, vowels, spinfo, rng):
+    """Writes a plotnik file with one token per stressed vowel"""
+    f = open(path, "w")
+    f.write(",".join(spinfo) + "\n")
+    f.write("%d,%d\n" % (len(vowels), len(vowels)))
+    for word, vowel, stress, xmin, xmax in vowels:
+        F1, F2 = FORMANTS[vowel]
+        env = "".join([str(rng.randint(0, 6)) for i in range(5)])
+        line = ["%d" % rng.gauss(F1, 40), "%d" % rng.gauss(F2, 80), "%d" % rng.gauss(2500, 100),
+                "%s.%s" % (PLOTNIK_CODES[vowel], env),
+                "%s.%d" % (stress, int(round((xmax - xmin) * 1000))),
+                "%s %.3f" % (word.lower(), (xmin + xmax) / 2)]
+        f.write(",".join(line) + "\n")
+    f.write("\n")
+    f.close()
+
+
+def synthesize(name, minutes, savepath = "", seed = 0):
+    """
+    Writes name.TextGrid and name.plt with about minutes of speech.
+    Returns their paths and the number of tokens.
+    """
+    rng = random.Random(seed)
+    phones, words, vowels, xmax = makeIntervals(minutes, rng)
+    spinfo = [name, "45", "f", "Philadelphia", "PA", "2010"]
+    tgfile = os.path.join(savepath, name + ".TextGrid")
+    pltfile = os.path.join(savepath, name + ".plt")
+    writeTextGrid(tgfile, phones, words, xmax, name)
+    writePlt(pltfile, vowels, spinfo, rng)
+    return(tgfile, pltfile, len(vowels))
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage = "%prog [options] name")
+    parser.add_option("-m", "--minutes", action = "store", type = "float", default = 10, dest = "minutes")
+    parser.add_option("-r", "--seed", action = "store", type = "int", default = 0, dest = "seed")
+    parser.add_option("-s", "--savepath", action = "store", default = "", dest = "savepath")
+
+    (options, args) = parser.parse_args()
+    tgfile, pltfile, ntokens = synthesize(args[0], options.minutes, options.savepath, options.seed)
+    print("Wrote %s and %s with %d tokens" % (tgfile, pltfile, ntokens))
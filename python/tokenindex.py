@@ -0,0 +1,187 @@
+"""
+A random access index over the tokens of .formants files and remeasure.py output,
+for jumping to tokens by vowel, word or time without reading the whole file.
+
+Building the index reads the file once and records, for every token line, its
+byte offset and length along with its vowel, word and start time. The index is
+kept next to the data file as file.idx, a columnar file sorted by start time.
+Queries look up the vowel and word codes and the time range in the index and
+read only the matching lines from a memory map of the data file.
+
+Usage:
+    python tokenindex.py build [-v CMUVowel] file.formants [file2.txt ...]
+    python tokenindex.py query [-v EY] [-w WORD] [-s start] [-e end] file.formants
+"""
+
+import mmap
+import optparse
+import os
+import sys
+
+import numpy
+
+import columnfile
+import tokentable
+
+
+SUFFIX = ".idx"
+HEADER_LINES = 3
+
+
+class TokenIndexError(Exception):
+    pass
+
+
+def indexPath(path):
+    return(path + SUFFIX)
+
+
+def readHeader(f):
+    """
+    Skips the header lines of a .formants or remeasure.py file open in binary mode.
+    Returns the column names and the offset of the first token line.
+    remeasure.py output names its columns on the line after the header;
+    .formants files do not, and have the tokentable.FORMANTS_COLUMNS.
+    """
+    for i in range(HEADER_LINES):
+        f.readline()
+    offset = f.tell()
+    line = f.readline()
+    fields = line.decode("utf-8").rstrip("\r\n").split("\t")
+    if fields[0] == "CMUVowel" and "beg" in fields:
+        return(fields, f.tell())
+    return(list(tokentable.FORMANTS_COLUMNS), offset)
+
+
+def buildIndex(path, vowelcol = "CMUVowel"):
+    """
+    Indexes the token lines of a data file, writing path.idx.
+    Returns the number of tokens indexed.
+    """
+    f = open(path, "rb")
+    names, offset = readHeader(f)
+    f.seek(offset)
+    vowelindex = names.index(vowelcol)
+    wordindex = names.index("Word")
+    begindex = names.index("beg")
+
+    offsets = []
+    lengths = []
+    begs = []
+    vowels = []
+    words = []
+    for line in f:
+        fields = line.decode("utf-8").rstrip("\r\n").split("\t")
+        if len(fields) > begindex:
+            offsets.append(offset)
+            lengths.append(len(line))
+            begs.append(tokentable.toFloat(fields[begindex]))
+            vowels.append(fields[vowelindex])
+            words.append(fields[wordindex].upper())
+        offset = offset + len(line)
+    f.close()
+
+    order = numpy.argsort(numpy.array(begs), kind = "mergesort")
+    vowelcodes, vowellevels, lookup = columnfile.intern(vowels)
+    wordcodes, wordlevels, lookup = columnfile.intern(words)
+    columns = [columnfile.Column("offset", columnfile.DOUBLE, numpy.array(offsets, dtype = numpy.float64)[order]),
+               columnfile.Column("length", columnfile.DOUBLE, numpy.array(lengths, dtype = numpy.float64)[order]),
+               columnfile.Column("beg", columnfile.DOUBLE, numpy.array(begs)[order]),
+               columnfile.Column(vowelcol, columnfile.FACTOR, vowelcodes[order], vowellevels),
+               columnfile.Column("Word", columnfile.FACTOR, wordcodes[order], wordlevels)]
+    columnfile.writeColumns(indexPath(path), columns)
+    return(len(offsets))
+
+
+class TokenIndex(object):
+    """
+    An open index and a memory map of its data file.
+    The index must be at least as new as the data file; rebuild it with buildIndex when it is not.
+    """
+
+    def __init__(self, path):
+        idx = indexPath(path)
+        if not os.path.exists(idx):
+            raise TokenIndexError("%s has no index; build one with tokenindex.py build" % path)
+        if os.path.getmtime(idx) < os.path.getmtime(path):
+            raise TokenIndexError("the index of %s is older than the file" % path)
+
+        columns = columnfile.readColumns(idx)
+        self.offset = columns[0].values.astype(numpy.int64)
+        self.length = columns[1].values.astype(numpy.int64)
+        self.beg = columns[2].values
+        self.vowelcol = columns[3].name
+        self.vowels = columns[3]
+        self.words = columns[4]
+        self.vowelcodes = dict((level, i) for i, level in enumerate(self.vowels.levels))
+        self.wordcodes = dict((level, i) for i, level in enumerate(self.words.levels))
+
+        f = open(path, "rb")
+        self.names = readHeader(f)[0]
+        self.size = os.fstat(f.fileno()).st_size
+        if len(self.offset) and (self.offset + self.length).max() > self.size:
+            f.close()
+            raise TokenIndexError("the index of %s does not match the file" % path)
+        self.data = None
+        if self.size > 0:
+            self.data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        f.close()
+
+    def __len__(self):
+        return(len(self.offset))
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+    def find(self, vowel = None, word = None, start = None, end = None):
+        """
+        Returns the index positions of tokens matching every given key, in order of start time.
+        start and end bound the start time, inclusively.
+        """
+        lo = 0
+        hi = len(self.beg)
+        if start is not None:
+            lo = numpy.searchsorted(self.beg, start, side = "left")
+        if end is not None:
+            hi = numpy.searchsorted(self.beg, end, side = "right")
+        mask = numpy.ones(max(hi - lo, 0), dtype = bool)
+        if vowel is not None:
+            mask &= self.vowels.values[lo:hi] == self.vowelcodes.get(vowel, -2)
+        if word is not None:
+            mask &= self.words.values[lo:hi] == self.wordcodes.get(word.upper(), -2)
+        return(numpy.flatnonzero(mask) + lo)
+
+    def line(self, i):
+        """Returns the text of the token line at index position i"""
+        offset = int(self.offset[i])
+        return(self.data[offset:offset + int(self.length[i])].decode("utf-8").rstrip("\r\n"))
+
+    def query(self, vowel = None, word = None, start = None, end = None):
+        """Returns the matching token lines, split into fields"""
+        return([self.line(i).split("\t") for i in self.find(vowel, word, start, end)])
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage = "%prog build|query [options] files")
+    parser.add_option("-v", "--vowel", action = "store", dest = "vowel",
+                      help = "vowel column to index when building, vowel to find when querying")
+    parser.add_option("-w", "--word", action = "store", dest = "word")
+    parser.add_option("-s", "--start", action = "store", type = "float", dest = "start")
+    parser.add_option("-e", "--end", action = "store", type = "float", dest = "end")
+
+    (options, args) = parser.parse_args()
+    if len(args) < 2 or args[0] not in ["build", "query"]:
+        parser.error("give build or query and a file")
+
+    if args[0] == "build":
+        for file in args[1:]:
+            n = buildIndex(file, options.vowel or "CMUVowel")
+            sys.stderr.write("Indexed %d tokens of %s\n" % (n, file))
+    else:
+        for file in args[1:]:
+            index = TokenIndex(file)
+            for i in index.find(options.vowel, options.word, options.start, options.end):
+                sys.stdout.write(index.line(i) + "\n")
+            index.close()
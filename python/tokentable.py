@@ -0,0 +1,262 @@
+"""
+Columnar token tables shared by getContext.py, recode.py and remeasure.py.
+
+A TokenTable keeps one column per measurement instead of one list per token.
+Numeric columns are stored in array('d') buffers, categorical columns
+(vowel classes, words, context codes) are interned into a list of levels
+plus an array('i') of codes, and free text columns are plain lists.
+Columns are looked up by name rather than by position in the input line.
+Numeric columns that are echoed to output can also keep their input text,
+and whole input lines can be kept, so that echoed values are written exactly
+as they were read.
+"""
+
+import array
+import math
+
+
+NA = float("nan")
+
+NUMERIC = "numeric"
+CATEGORICAL = "categorical"
+TEXT = "text"
+
+
+## Column layout of an extractFormants .formants file
+FORMANTS_COLUMNS = ["CMUVowel", "Stress", "Word",
+                    "F1", "F2", "F3", "B1", "B2", "B3",
+                    "t", "beg", "end", "dur",
+                    "cd", "fm", "fp", "fv", "ps", "fs", "style", "glide",
+                    "poles", "bandwidths"]
+FORMANTS_NUMERIC = ["F1", "F2", "F3", "B1", "B2", "B3", "t", "beg", "end", "dur"]
+FORMANTS_TEXT = ["poles", "bandwidths"]
+
+## Column layout of a plotnik .plt token line
+PLT_COLUMNS = ["F1", "F2", "F3", "VCoding", "Dur_Stress", "Info"]
+PLT_NUMERIC = ["F1", "F2", "F3"]
+PLT_TEXT = ["Dur_Stress", "Info"]
+
+
+def toFloat(value):
+    """Converts a field to a float, with empty and NA fields becoming NaN"""
+    if value == "" or value == "NA":
+        return(NA)
+    return(float(value))
+
+
+def isNA(value):
+    """Tests for a missing numeric value"""
+    return(value != value)
+
+
+def formatValue(value):
+    """Formats a numeric value for tab delimited output"""
+    if isNA(value):
+        return("")
+    if value == math.floor(value) and abs(value) < 1e15:
+        return("%d" % value)
+    return(repr(value))
+
+
+class TokenTable(object):
+    """
+    A table of tokens stored column by column.
+    raw names numeric columns whose input text is kept alongside their values,
+    and with keepLines the input line of each token is kept in lines.
+    """
+
+    def __init__(self, names, numeric = (), categorical = (), raw = (), keepLines = False):
+        self.names = list(names)
+        self.kinds = {}
+        self.columns = {}
+        self.levels = {}
+        self.text = {}
+        self.lines = None
+        if keepLines:
+            self.lines = []
+        self._index = {}
+        self._n = 0
+
+        for name in self.names:
+            if name in numeric:
+                self.kinds[name] = NUMERIC
+                self.columns[name] = array.array("d")
+                if name in raw:
+                    self.text[name] = []
+            elif name in categorical:
+                self.kinds[name] = CATEGORICAL
+                self.columns[name] = array.array("i")
+                self.levels[name] = []
+                self._index[name] = {}
+            else:
+                self.kinds[name] = TEXT
+                self.columns[name] = []
+
+    def __len__(self):
+        return(self._n)
+
+    def __contains__(self, name):
+        return(name in self.kinds)
+
+    def intern(self, name, value):
+        """Returns the code of a categorical value, adding it as a new level if needed"""
+        index = self._index[name]
+        code = index.get(value)
+        if code is None:
+            code = len(self.levels[name])
+            index[value] = code
+            self.levels[name].append(value)
+        return(code)
+
+    def append(self, fields, line = None):
+        """Adds a token given as a list of string fields in column order, and its input line if lines are kept"""
+        if self.lines is not None:
+            self.lines.append(line)
+        for name, value in zip(self.names, fields):
+            kind = self.kinds[name]
+            if kind == NUMERIC:
+                self.columns[name].append(toFloat(value))
+                if name in self.text:
+                    self.text[name].append(value)
+            elif kind == CATEGORICAL:
+                self.columns[name].append(self.intern(name, value))
+            else:
+                self.columns[name].append(value)
+        ## Short lines are padded so that every column stays the same length
+        for name in self.names[len(fields):]:
+            kind = self.kinds[name]
+            if kind == NUMERIC:
+                self.columns[name].append(NA)
+                if name in self.text:
+                    self.text[name].append("")
+            elif kind == CATEGORICAL:
+                self.columns[name].append(self.intern(name, ""))
+            else:
+                self.columns[name].append("")
+        self._n = self._n + 1
+
+    def get(self, name, i):
+        """Returns the value of column name for token i"""
+        if self.kinds[name] == CATEGORICAL:
+            return(self.levels[name][self.columns[name][i]])
+        return(self.columns[name][i])
+
+    def values(self, name):
+        """Returns a whole column, with categorical codes decoded into labels"""
+        if self.kinds[name] == CATEGORICAL:
+            levels = self.levels[name]
+            return([levels[code] for code in self.columns[name]])
+        return(self.columns[name])
+
+    def codes(self, name):
+        """Returns the array of codes and the list of levels of a categorical column"""
+        return(self.columns[name], self.levels[name])
+
+    def field(self, name, i):
+        """Returns the value of column name for token i formatted for output, as read if its text is kept"""
+        if name in self.text:
+            return(self.text[name][i])
+        if self.kinds[name] == NUMERIC:
+            return(formatValue(self.columns[name][i]))
+        return(self.get(name, i))
+
+    def row(self, i, names = None):
+        """Returns token i as a list of output strings"""
+        if names is None:
+            names = self.names
+        return([self.field(name, i) for name in names])
+
+    def groupBy(self, name):
+        """
+        Returns a dictionary of token indices keyed by the labels of a categorical column.
+        """
+        codes, levels = self.codes(name)
+        groups = [array.array("i") for level in levels]
+        for i in range(self._n):
+            groups[codes[i]].append(i)
+        return(dict(zip(levels, groups)))
+
+
+def uniqueNames(names):
+    """Makes column names unique by suffixing repeats, as R's make.unique does"""
+    seen = {}
+    out = []
+    for name in names:
+        if name in seen:
+            seen[name] = seen[name] + 1
+            out.append("%s.%d" % (name, seen[name]))
+        else:
+            seen[name] = 0
+            out.append(name)
+    return(out)
+
+
+def loadFormants(file):
+    """
+    Loads an extractFormants .formants file.
+    Returns the speaker header line and a TokenTable.
+    """
+    f = open(file)
+    header = f.readline()
+    f.readline()
+    f.readline()
+    table = TokenTable(FORMANTS_COLUMNS,
+                       numeric = FORMANTS_NUMERIC,
+                       categorical = [x for x in FORMANTS_COLUMNS
+                                      if x not in FORMANTS_NUMERIC and x not in FORMANTS_TEXT],
+                       raw = FORMANTS_NUMERIC)
+    for line in f:
+        line = line.rstrip()
+        if line == "":
+            continue
+        table.append(line.split("\t"))
+    f.close()
+    return(header, table)
+
+
+def loadPlt(file):
+    """
+    Loads a plotnik .plt file.
+    Returns the speaker info and a TokenTable with the plotnik columns
+    plus Word and Time taken from the Info field.
+    """
+    f = open(file)
+    spinfo = f.readline().rstrip().split(",")
+    f.readline()
+    table = TokenTable(PLT_COLUMNS + ["Word", "Time"],
+                       numeric = PLT_NUMERIC + ["Time"],
+                       categorical = ["VCoding", "Word"],
+                       raw = PLT_NUMERIC)
+    for line in f:
+        line = line.rstrip()
+        if line == "":
+            break
+        fields = line.split(",")
+        info = fields[-1]
+        infofields = info.split(" ")
+        table.append(fields[:5] + [info, infofields[0], infofields[-1]])
+    f.close()
+    return(spinfo, table)
+
+
+def loadDelimited(file, categorical = (), numeric = (), sep = "\t", keepLines = False):
+    """
+    Loads a delimited file with a header line, such as recode.py input.
+    categorical and numeric are 0 based column indices; all other columns are kept as text.
+    With keepLines, each token's input line (without trailing whitespace) is kept in table.lines.
+    Returns the header line and a TokenTable named by the header.
+    """
+    f = open(file)
+    header = f.readline().rstrip()
+    names = uniqueNames(header.split(sep))
+    table = TokenTable(names,
+                       numeric = [names[i] for i in numeric],
+                       categorical = [names[i] for i in categorical],
+                       keepLines = keepLines)
+    for line in f:
+        line = line.rstrip()
+        if len(line) < 1:
+            break
+        table.append(line.split(sep), line)
+    f.close()
+    return(header, table)
@@ -0,0 +1,293 @@
+"""
+Loads and summarizes the formant tracks written by praat/tracker.Praat.
+
+tracker.Praat writes one line per 6 ms frame:
+Time.s, nformants, F1, B1 ... Fn, Bn, Vowel, Word, ID, Transcription, Index
+Praat lists one F/B pair per formant the analysis allowed, so n depends on the
+run's nformants setting, and runs appended to one file may differ. Each line's
+layout is found from its field count: the 5 labels are the last fields and the
+rest holds (nfields - 7) / 2 formant pairs. Files are split into runs at the
+header lines with array operations over the raw bytes, each run is parsed by
+loadtxt with its own layout, and formants a run lacks are NaN.
+Frames are read into contiguous numpy arrays and grouped into tokens, and
+every summary is computed for all tokens at once with reductions over the
+token boundaries rather than a loop over tokens.
+
+Usage:
+    python tracker.py [-o summary.txt] [-k ncoefs] ey.txt [ay.txt ...]
+"""
+
+import io
+import optparse
+import sys
+
+import numpy
+
+import tokentable
+
+
+TRACKER_NUMERIC = ["Time.s", "nformants"]
+TRACKER_LABELS = ["Vowel", "Word", "ID", "Transcription", "Index"]
+NFORMANTS = 5
+
+POINTS = [0.2, 0.5, 0.8]
+SUMMARY_FORMANTS = ["F1", "F2"]
+
+
+class Frames(object):
+    """
+    Formant frames from one or more tracker files, grouped by token.
+
+    time, nformants, F and B have one entry per frame, with F and B holding
+    F1, F2 ... and B1, B2 ... as columns (at least NFORMANTS of them, NaN where
+    a run had fewer). starts and lengths give the first frame
+    and number of frames of each token, and labels holds the Vowel, Word,
+    ID, Transcription and Index fields of each token along with its file.
+    """
+
+    def __init__(self, time, nformants, F, B, starts, labels):
+        self.time = time
+        self.nformants = nformants
+        self.F = F
+        self.B = B
+        self.starts = starts
+        self.lengths = numpy.diff(numpy.append(starts, len(time)))
+        self.labels = labels
+
+    def __len__(self):
+        return(len(self.starts))
+
+    def formant(self, name):
+        """Returns the per frame values of F1, F2 ... or B1, B2 ... by name"""
+        if name[0] == "F":
+            return(self.F[:, int(name[1:]) - 1])
+        return(self.B[:, int(name[1:]) - 1])
+
+    def token(self):
+        """Returns the token number of every frame"""
+        return(numpy.repeat(numpy.arange(len(self.starts)), self.lengths))
+
+
+def trackerBlocks(file):
+    """
+    Splits a tracker file into blocks of frame lines, one per run, at the header line each run writes.
+    Empty lines are left out, as are runs with a header but no frames. Returns the file's
+    bytes and a list of (first byte, end byte, nfields, frame line starts, frame line ends)
+    blocks, with nfields taken from the block's first line.
+    """
+    f = open(file, "rb")
+    text = f.read().replace(b"--undefined--", b"nan")
+    f.close()
+    if not text:
+        return(text, [])
+    if not text.endswith(b"\n"):
+        text = text + b"\n"
+
+    data = numpy.frombuffer(text, dtype = numpy.uint8)
+    ends = numpy.flatnonzero(data == ord("\n"))
+    begins = numpy.append(0, ends[:-1] + 1).astype(ends.dtype)
+    nonempty = ends > begins
+    header = nonempty & (data[numpy.minimum(begins, len(data) - 1)] == ord("T"))
+    run = numpy.cumsum(header)
+
+    frames = numpy.flatnonzero(nonempty & ~header)
+    if len(frames) == 0:
+        return(text, [])
+    breaks = numpy.flatnonzero(numpy.diff(run[frames]) != 0) + 1
+    bounds = numpy.concatenate([[0], breaks, [len(frames)]]).astype(numpy.intp)
+
+    blocks = []
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        lines = frames[a:b]
+        first = begins[lines[0]]
+        nfields = text[first:ends[lines[0]]].count(b"\t") + 1
+        blocks.append((first, ends[lines[-1]] + 1, nfields, begins[lines], ends[lines]))
+    return(text, blocks)
+
+
+def tokenStarts(time, ids):
+    """
+    Finds the first frame of each token.
+    A token starts wherever the ID changes or time runs backwards, which
+    also separates the output of separate runs appended to the same file.
+    """
+    if len(time) == 0:
+        return(numpy.zeros(0, dtype = numpy.intp))
+    breaks = (numpy.diff(ids) != 0) | (numpy.diff(time) < 0)
+    return(numpy.append(0, numpy.flatnonzero(breaks) + 1))
+
+
+def padFormants(blocks, width):
+    """Stacks (frames x pairs) blocks into one (frames x width) array, padding with NaN"""
+    out = numpy.empty((sum([len(x) for x in blocks]), width))
+    out.fill(numpy.nan)
+    row = 0
+    for x in blocks:
+        out[row:row + len(x), :x.shape[1]] = x
+        row = row + len(x)
+    return(out)
+
+
+def loadTracker(files):
+    """
+    Loads tracker files into a single Frames object.
+    """
+    times = []
+    nformants = []
+    Fs = []
+    Bs = []
+    starts = []
+    labels = []
+    offset = 0
+    width = NFORMANTS
+
+    for file in files:
+        text, blocks = trackerBlocks(file)
+        for first, last, nfields, begins, ends in blocks:
+            npairs = (nfields - 2 - len(TRACKER_LABELS)) // 2
+            idcol = 2 + 2 * npairs + TRACKER_LABELS.index("ID")
+            block = io.StringIO(text[first:last].decode("utf-8"))
+            numeric = numpy.loadtxt(block, delimiter = "\t", usecols = list(range(2 + 2 * npairs)) + [idcol],
+                                    ndmin = 2, comments = None)
+            time = numeric[:, 0]
+            fstarts = tokenStarts(time, numeric[:, -1])
+
+            times.append(time)
+            nformants.append(numeric[:, 1])
+            Fs.append(numeric[:, 2:2 + 2 * npairs:2])
+            Bs.append(numeric[:, 3:2 + 2 * npairs:2])
+            width = max(width, npairs)
+            starts.append(fstarts + offset)
+            for start in fstarts:
+                fields = text[begins[start]:ends[start]].rstrip(b"\r").rsplit(b"\t", len(TRACKER_LABELS))[1:]
+                labels.append([file] + [x.decode("utf-8") for x in fields])
+            offset = offset + len(time)
+
+    if offset == 0:
+        empty = numpy.zeros(0)
+        return(Frames(empty, empty, numpy.zeros((0, width)), numpy.zeros((0, width)),
+                      numpy.zeros(0, dtype = numpy.intp), []))
+
+    return(Frames(numpy.concatenate(times),
+                  numpy.concatenate(nformants),
+                  padFormants(Fs, width),
+                  padFormants(Bs, width),
+                  numpy.concatenate(starts),
+                  labels))
+
+
+def valuesAt(frames, values, proportion):
+    """
+    Linearly interpolates values at a proportion of each token's duration.
+    """
+    last = frames.starts + frames.lengths - 1
+    position = proportion * (frames.lengths - 1)
+    lo = frames.starts + numpy.floor(position).astype(numpy.intp)
+    hi = numpy.minimum(lo + 1, last)
+    frac = position - numpy.floor(position)
+    return(values[lo] * (1 - frac) + values[hi] * frac)
+
+
+def slopes(frames, values):
+    """
+    Least squares slope of values over time (Hz per second) for each token.
+    Undefined frames are left out of the fit.
+    """
+    starts = frames.starts
+    ok = numpy.isfinite(values)
+    t = numpy.where(ok, frames.time - frames.time[starts].repeat(frames.lengths), 0.0)
+    y = numpy.where(ok, values, 0.0)
+
+    n = numpy.add.reduceat(ok.astype(float), starts)
+    st = numpy.add.reduceat(t, starts)
+    sy = numpy.add.reduceat(y, starts)
+    stt = numpy.add.reduceat(t * t, starts)
+    sty = numpy.add.reduceat(t * y, starts)
+
+    denom = n * stt - st * st
+    with numpy.errstate(divide = "ignore", invalid = "ignore"):
+        out = (n * sty - st * sy) / denom
+    out[denom <= 0] = numpy.nan
+    return(out)
+
+
+def dctCoefficients(frames, values, ncoefs = 3):
+    """
+    Returns the first ncoefs DCT-II coefficients of values for each token,
+    as a (tokens x ncoefs) array. Coefficients are scaled by the number of
+    defined frames, so coefficient 0 is the token mean. Tokens with
+    fewer than k+1 frames get NaN for coefficient k, and undefined frames
+    are left out of the sums.
+    """
+    starts = frames.starts
+    lengths = frames.lengths.repeat(frames.lengths)
+    position = numpy.arange(len(frames.time)) - starts.repeat(frames.lengths)
+    ok = numpy.isfinite(values)
+    y = numpy.where(ok, values, 0.0)
+    n = numpy.add.reduceat(ok.astype(float), starts)
+
+    out = numpy.empty((len(starts), ncoefs))
+    for k in range(ncoefs):
+        basis = numpy.cos(numpy.pi * k * (position + 0.5) / lengths)
+        with numpy.errstate(divide = "ignore", invalid = "ignore"):
+            out[:, k] = numpy.add.reduceat(y * basis, starts) / n
+        out[frames.lengths <= k, k] = numpy.nan
+    return(out)
+
+
+def summarize(frames, formants = SUMMARY_FORMANTS, points = POINTS, ncoefs = 3):
+    """
+    Computes per token summaries of the frames.
+    Returns a list of column names and a matching list of per token arrays.
+    """
+    names = []
+    columns = []
+    starts = frames.starts
+    last = starts + frames.lengths - 1
+
+    names.extend(["beg", "end", "dur", "nframes"])
+    columns.extend([frames.time[starts], frames.time[last],
+                    frames.time[last] - frames.time[starts], frames.lengths])
+
+    for formant in formants:
+        values = frames.formant(formant)
+        for p in points:
+            names.append("%s_%d" % (formant, int(round(p * 100))))
+            columns.append(valuesAt(frames, values, p))
+        names.append("%s_slope" % formant)
+        columns.append(slopes(frames, values))
+        coefs = dctCoefficients(frames, values, ncoefs)
+        for k in range(ncoefs):
+            names.append("%s_dct%d" % (formant, k))
+            columns.append(coefs[:, k])
+
+    return(names, columns)
+
+
+def writeSummary(frames, names, columns, out):
+    """Writes token summaries as a tab delimited table"""
+    out.write("\t".join(["File"] + TRACKER_LABELS + names) + "\n")
+    for i in range(len(frames)):
+        values = [tokentable.formatValue(float(column[i])) for column in columns]
+        out.write("\t".join(frames.labels[i] + values) + "\n")
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option("-o", "--output", action = "store", dest = "output")
+    parser.add_option("-k", "--ncoefs", action = "store", type = "int", default = 3, dest = "ncoefs")
+
+    (options, args) = parser.parse_args()
+
+    sys.stderr.write("Reading frames...")
+    frames = loadTracker(args)
+    sys.stderr.write("%d frames in %d tokens\n" % (len(frames.time), len(frames)))
+
+    names, columns = summarize(frames, ncoefs = options.ncoefs)
+
+    if options.output is None:
+        writeSummary(frames, names, columns, sys.stdout)
+    else:
+        out = open(options.output, "w")
+        writeSummary(frames, names, columns, out)
+        out.close()
@@ -0,0 +1,177 @@
+"""
+Chooses a smooth formant track for each token from several tracker.Praat
+runs with different analysis settings (for example nformants 3 to 6).
+tracker.loadTracker reads each run's own number of formants, and formants a
+run does not have are NaN.
+
+Every frame of every candidate is scored by its squared Mahalanobis distance
+from the speaker's model of the token's vowel, and moving between candidates
+from one frame to the next costs the squared jump in F1 and F2 in units of
+the vowel's standard deviations, times a weight. A Viterbi pass picks the
+cheapest sequence of candidates for each token.
+
+The pass steps through frame positions rather than tokens: at step t every
+token still longer than t is advanced at once, with the candidate to candidate
+costs computed as a (tokens x candidates x candidates) array, so the work is
+proportional to frames x candidates^2.
+"""
+
+import numpy
+
+import tokentable
+import tracker
+
+
+BIG = 1e6
+FEATURES = 4
+
+
+class TrackError(Exception):
+    pass
+
+
+def candidateFeatures(candidates):
+    """
+    Stacks F1, F2, log(B1) and log(B2) from each candidate run into a (frames x candidates x 4) array.
+    The runs must hold the same tokens and frames.
+    """
+    first = candidates[0]
+    for frames in candidates[1:]:
+        if len(frames.time) != len(first.time) or not numpy.allclose(frames.time, first.time):
+            raise TrackError("tracker runs do not have the same frames")
+        if not numpy.array_equal(frames.starts, first.starts):
+            raise TrackError("tracker runs do not have the same tokens")
+
+    X = numpy.empty((len(first.time), len(candidates), FEATURES))
+    with numpy.errstate(divide = "ignore", invalid = "ignore"):
+        for c, frames in enumerate(candidates):
+            X[:, c, 0] = frames.F[:, 0]
+            X[:, c, 1] = frames.F[:, 1]
+            X[:, c, 2] = numpy.log(frames.B[:, 0])
+            X[:, c, 3] = numpy.log(frames.B[:, 1])
+    return(X)
+
+
+def tokenVowels(frames):
+    """Returns the vowel code of each token and the list of vowels"""
+    index = {}
+    vowels = []
+    codes = numpy.empty(len(frames), dtype = numpy.intp)
+    for i, labels in enumerate(frames.labels):
+        vowel = labels[1]
+        if vowel not in index:
+            index[vowel] = len(vowels)
+            vowels.append(vowel)
+        codes[i] = index[vowel]
+    return(codes, vowels)
+
+
+def frameCosts(X, framevowels, vowels, models):
+    """
+    Squared Mahalanobis distance of every frame and candidate from its vowel's model.
+    models maps vowels to (mean, covariance) over the FEATURES dimensions;
+    vowels without a model cost 0 everywhere, so only smoothness decides them.
+    Also returns each frame's F1 and F2 standard deviations for scaling jumps.
+    """
+    D = numpy.zeros(X.shape[:2])
+    sd = numpy.ones((X.shape[0], 2))
+    for v, vowel in enumerate(vowels):
+        mask = framevowels == v
+        if not mask.any():
+            continue
+        if vowel in models:
+            mean, cov = models[vowel]
+            icov = numpy.linalg.pinv(cov)
+            d = X[mask] - mean
+            D[mask] = numpy.einsum("mcj,jk,mck->mc", d, icov, d)
+            sd[mask] = numpy.sqrt(numpy.diag(cov)[:2])
+        else:
+            with numpy.errstate(invalid = "ignore"):
+                spread = numpy.nanstd(X[mask][:, :, :2].reshape(-1, 2), axis = 0)
+            sd[mask] = numpy.where(numpy.isfinite(spread) & (spread > 0), spread, 1.0)
+    D[~numpy.isfinite(D)] = BIG
+    return(D, sd)
+
+
+def viterbi(starts, lengths, X, D, sd, jump = 1.0):
+    """
+    Returns the chosen candidate for every frame and the total cost of each token's track.
+    """
+    ntokens = len(starts)
+    nframes, ncands = D.shape
+    choice = numpy.zeros(nframes, dtype = numpy.intp)
+    if ntokens == 0:
+        return(choice, numpy.zeros(0))
+
+    order = numpy.argsort(-lengths, kind = "mergesort")
+    ostarts = starts[order]
+    ascending = numpy.sort(lengths)
+    maxlen = int(ascending[-1])
+    active = ntokens - numpy.searchsorted(ascending, numpy.arange(maxlen), side = "right")
+
+    F = X[:, :, :2]
+    back = numpy.zeros((nframes, ncands), dtype = numpy.int16)
+    acc = D[ostarts].copy()
+
+    for t in range(1, maxlen):
+        k = active[t]
+        idx = ostarts[:k] + t
+        step = (F[idx][:, numpy.newaxis, :, :] - F[idx - 1][:, :, numpy.newaxis, :]) / sd[idx][:, numpy.newaxis, numpy.newaxis, :]
+        step = numpy.where(numpy.isfinite(step), step, 0.0)
+        total = acc[:k, :, numpy.newaxis] + jump * (step * step).sum(axis = -1)
+        best = total.argmin(axis = 1)
+        back[idx] = best
+        acc[:k] = numpy.take_along_axis(total, best[:, numpy.newaxis, :], axis = 1)[:, 0, :] + D[idx]
+
+    cur = acc.argmin(axis = 1)
+    cost = numpy.empty(ntokens)
+    cost[order] = acc[numpy.arange(ntokens), cur]
+    for t in range(maxlen - 1, -1, -1):
+        k = active[t]
+        idx = ostarts[:k] + t
+        choice[idx] = cur[:k]
+        if t > 0:
+            cur[:k] = back[idx, cur[:k]]
+    return(choice, cost)
+
+
+def selectTracks(candidates, models, jump = 1.0):
+    """
+    Chooses a track for every token of a list of tracker.Frames runs.
+    Returns the chosen candidate and its distance for every frame, and the cost of each token.
+    """
+    X = candidateFeatures(candidates)
+    first = candidates[0]
+    codes, vowels = tokenVowels(first)
+    framevowels = codes.repeat(first.lengths)
+    D, sd = frameCosts(X, framevowels, vowels, models)
+    choice, cost = viterbi(first.starts, first.lengths, X, D, sd, jump)
+    dist = D[numpy.arange(len(choice)), choice]
+    return(choice, dist, cost)
+
+
+def stackFormants(arrays):
+    """Stacks (frames x formants) arrays into (frames x candidates x formants), padding narrower ones with NaN"""
+    width = max([x.shape[1] for x in arrays])
+    out = numpy.empty((arrays[0].shape[0], len(arrays), width))
+    out.fill(numpy.nan)
+    for c, x in enumerate(arrays):
+        out[:, c, :x.shape[1]] = x
+    return(out)
+
+
+def writeTracks(out, candidates, choice, dist):
+    """Writes the chosen track of every frame as a tab delimited table"""
+    first = candidates[0]
+    frame = numpy.arange(len(choice))
+    F = stackFormants([frames.F for frames in candidates])[frame, choice]
+    B = stackFormants([frames.B for frames in candidates])[frame, choice]
+    nformants = numpy.stack([frames.nformants for frames in candidates], axis = 1)[frame, choice]
+
+    out.write("\t".join(["File"] + tracker.TRACKER_LABELS +
+                        ["Time", "candidate", "nformants", "F1", "F2", "F3", "B1", "B2", "B3", "dist"]) + "\n")
+    for i in range(len(first)):
+        labels = "\t".join(first.labels[i])
+        for j in range(first.starts[i], first.starts[i] + first.lengths[i]):
+            values = [first.time[j], choice[j] + 1, nformants[j]] + list(F[j, :3]) + list(B[j, :3]) + [dist[j]]
+            out.write(labels + "\t" + "\t".join([tokentable.formatValue(float(x)) for x in values]) + "\n")
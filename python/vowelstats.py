@@ -0,0 +1,242 @@
+"""
+Sufficient statistics of the remeasure.py vowel measurements, which can be
+gathered per speaker file and merged into corpus wide vowel models.
+
+For each vowel class the statistics are the token count, the sum of the
+measurement vectors and the sum of their cross products, over the same
+measurements remeasure.py uses: F1, F2, log(B1), log(B2) and log(Dur).
+Merging is addition, so files can be summarized in parallel or in separate
+runs and merged in any order. remeasure.py -p corpus.stats uses the merged
+means and covariances for vowel classes a speaker has too few tokens of.
+
+Usage:
+    python vowelstats.py emit [-n jobs] [-v cd] -o corpus.stats a.formants b.formants ...
+    python vowelstats.py merge -o corpus.stats a.stats b.stats ...
+"""
+
+import math
+import optparse
+import random
+import sys
+import zlib
+
+import tokentable
+
+
+FEATURES = ["F1", "F2", "logB1", "logB2", "logDur"]
+
+
+def vowelFeatures(table, vowelcol):
+    """
+    Returns a dictionary of [F1, F2, log(B1), log(B2), log(Dur)] token lists
+    by the vowel classes in column vowelcol of a .formants TokenTable.
+    """
+    vowels = {}
+    F1s = table.columns["F1"]
+    F2s = table.columns["F2"]
+    B1s = table.columns["B1"]
+    B2s = table.columns["B2"]
+    Durs = table.columns["dur"]
+    log = math.log
+
+    for vowel, tokens in table.groupBy(vowelcol).items():
+#        vowels[vowel] = [[F1s[i], F2s[i], F3s[i], log(B1s[i]), log(B2s[i]), log(B3s[i]), log(Durs[i])] for i in tokens]
+        vowels[vowel] = [[F1s[i], F2s[i], log(B1s[i]), log(B2s[i]), log(Durs[i])] for i in tokens]
+    return(vowels)
+
+
+def reservoirSample(tokens, k, rng):
+    """A uniform sample of at most k tokens, in one pass over tokens"""
+    sample = []
+    for i, token in enumerate(tokens):
+        if i < k:
+            sample.append(token)
+        else:
+            j = rng.randint(0, i)
+            if j < k:
+                sample[j] = token
+    return(sample)
+
+
+def vowelSeed(seed, vowel):
+    """
+    Combines seed with a CRC of the vowel's name into an integer seed.
+    Integer seeds give the same generator on every platform, where Python 2
+    seeds string seeds from hash(), which varies by build and hash seed.
+    """
+    return((seed << 32) + (zlib.crc32(vowel.encode("utf-8")) & 0xffffffff))
+
+
+def sampleVowels(vowels, k, seed = 0):
+    """
+    Caps each vowel class of a vowelFeatures dictionary at k tokens.
+    Each class is sampled with its own generator seeded from seed and the vowel,
+    so the sample of one class does not depend on the others.
+    """
+    sampled = {}
+    for vowel in vowels:
+        if len(vowels[vowel]) <= k:
+            sampled[vowel] = vowels[vowel]
+        else:
+            sampled[vowel] = reservoirSample(vowels[vowel], k, random.Random(vowelSeed(seed, vowel)))
+    return(sampled)
+
+
+class VowelStats(object):
+    """
+    Per vowel token counts, sums and cross product sums.
+    stats[vowel] is [n, sums, cross], with cross a list of rows.
+    """
+
+    def __init__(self, features = FEATURES):
+        self.features = list(features)
+        self.stats = {}
+
+    def __contains__(self, vowel):
+        return(vowel in self.stats)
+
+    def __len__(self):
+        return(len(self.stats))
+
+    def vowels(self):
+        return(sorted(self.stats.keys()))
+
+    def empty(self):
+        k = len(self.features)
+        return([0, [0.0] * k, [[0.0] * k for i in range(k)]])
+
+    def add(self, vowel, token):
+        """Adds one token's measurement vector, skipping tokens with missing values"""
+        for x in token:
+            if x != x or x in (float("inf"), float("-inf")):
+                return
+        if vowel not in self.stats:
+            self.stats[vowel] = self.empty()
+        entry = self.stats[vowel]
+        entry[0] = entry[0] + 1
+        sums = entry[1]
+        cross = entry[2]
+        k = len(token)
+        for a in range(k):
+            sums[a] = sums[a] + token[a]
+            row = cross[a]
+            xa = token[a]
+            for b in range(k):
+                row[b] = row[b] + xa * token[b]
+
+    def addVowels(self, vowels):
+        """Adds a dictionary of token lists by vowel, as made by vowelFeatures"""
+        for vowel in vowels:
+            for token in vowels[vowel]:
+                self.add(vowel, token)
+
+    def merge(self, other):
+        """Adds another VowelStats into this one"""
+        if other.features != self.features:
+            raise ValueError("cannot merge statistics of different measurements")
+        for vowel in other.stats:
+            if vowel not in self.stats:
+                self.stats[vowel] = self.empty()
+            mine = self.stats[vowel]
+            theirs = other.stats[vowel]
+            mine[0] = mine[0] + theirs[0]
+            k = len(self.features)
+            for a in range(k):
+                mine[1][a] = mine[1][a] + theirs[1][a]
+                for b in range(k):
+                    mine[2][a][b] = mine[2][a][b] + theirs[2][a][b]
+        return(self)
+
+    def count(self, vowel):
+        return(self.stats[vowel][0])
+
+    def mean(self, vowel):
+        n, sums, cross = self.stats[vowel]
+        return([s / n for s in sums])
+
+    def covariance(self, vowel):
+        """The sample covariance matrix of a vowel, as a list of rows"""
+        n, sums, cross = self.stats[vowel]
+        k = len(sums)
+        return([[(cross[a][b] - sums[a] * sums[b] / n) / (n - 1) for b in range(k)] for a in range(k)])
+
+    def write(self, path):
+        """Writes the statistics as a tab delimited table, one vowel per line"""
+        k = len(self.features)
+        names = ["n"] + ["sum_" + x for x in self.features]
+        names = names + ["cross_%s_%s" % (self.features[a], self.features[b]) for a in range(k) for b in range(k)]
+        f = open(path, "w")
+        f.write("\t".join(["vowel"] + names) + "\n")
+        for vowel in self.vowels():
+            n, sums, cross = self.stats[vowel]
+            values = [repr(float(x)) for x in sums] + [repr(float(cross[a][b])) for a in range(k) for b in range(k)]
+            f.write("\t".join([vowel, "%d" % n] + values) + "\n")
+        f.close()
+
+
+def readStats(path):
+    """Reads statistics written by VowelStats.write"""
+    f = open(path)
+    names = f.readline().rstrip("\n").split("\t")
+    features = [x[len("sum_"):] for x in names if x.startswith("sum_")]
+    k = len(features)
+    stats = VowelStats(features)
+    for line in f:
+        line = line.rstrip("\n").split("\t")
+        if len(line) < 2:
+            continue
+        values = [float(x) for x in line[2:]]
+        cross = [values[k + a * k : k + (a + 1) * k] for a in range(k)]
+        stats.stats[line[0]] = [int(line[1]), values[:k], cross]
+    f.close()
+    return(stats)
+
+
+def fileStats(args):
+    """Gathers the statistics of one .formants file"""
+    file, vowelcol = args
+    header, table = tokentable.loadFormants(file)
+    stats = VowelStats()
+    stats.addVowels(vowelFeatures(table, vowelcol))
+    return(stats)
+
+
+def emit(files, vowelcol = "cd", jobs = 1):
+    """Gathers and merges the statistics of many .formants files, using jobs processes"""
+    work = [(file, vowelcol) for file in files]
+    if jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs)
+        results = pool.imap_unordered(fileStats, work)
+    else:
+        results = map(fileStats, work)
+
+    total = VowelStats()
+    for stats in results:
+        total.merge(stats)
+    if jobs > 1:
+        pool.close()
+        pool.join()
+    return(total)
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage = "%prog emit|merge [options] files")
+    parser.add_option("-o", "--output", action = "store", default = "corpus.stats", dest = "output")
+    parser.add_option("-v", "--vowel", action = "store", default = "cd", dest = "vowel",
+                      help = "column identifying vowel classes")
+    parser.add_option("-n", "--jobs", action = "store", type = "int", default = 1, dest = "jobs")
+
+    (options, args) = parser.parse_args()
+    if len(args) < 1 or args[0] not in ["emit", "merge"]:
+        parser.error("give emit or merge")
+
+    if args[0] == "emit":
+        total = emit(args[1:], options.vowel, options.jobs)
+    else:
+        total = VowelStats()
+        for file in args[1:]:
+            total.merge(readStats(file))
+
+    total.write(options.output)
+    sys.stderr.write("Wrote %d vowel classes to %s\n" % (len(total), options.output))